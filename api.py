@@ -1,12 +1,13 @@
 """ search business logic implementations """
-from datetime import datetime
+import base64
+import json
 
 from django.conf import settings
 
 from .filter_generator import SearchFilterGenerator
 from .search_engine_base import SearchEngine
 from .result_processor import SearchResultProcessor
-from .utils import DateRange
+from .utils import DateRange, _utcnow_to_the_minute
 
 # Default filters that we support, override using COURSE_DISCOVERY_FILTERS setting if desired
 DEFAULT_FILTER_FIELDS = ["org", "modes", "language"]
@@ -27,13 +28,56 @@ class NoSearchEngineError(Exception):
     pass
 
 
+def _decode_cursor(cursor):
+    """ Find the search_after values from the cursor - an empty cursor asks for the first page """
+    if not cursor:
+        return []
+    try:
+        search_after = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        search_after = None
+    if not isinstance(search_after, list) or len(search_after) != 2:
+        raise ValueError("Invalid cursor {}".format(cursor))
+    return search_after
+
+
+def _encode_cursor(results, size):
+    """ Cursor from which to continue after these results, or None when there are no more pages """
+    if not results["results"] or len(results["results"]) < size:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(results["results"][-1]["sort"]))
+
+
+def _search_with_cursor(search, cursor, size, from_, **kwargs):
+    """
+    Perform the search, paging using search_after when a cursor is provided (even an empty one),
+    and include the cursor for the next page within the results
+    """
+    if cursor is None:
+        return search(size=size, from_=from_, **kwargs)
+
+    results = search(size=size, from_=0, search_after=_decode_cursor(cursor), **kwargs)
+    results["cursor"] = _encode_cursor(results, size)
+    return results
+
+
 def perform_search(
         search_term,
         user=None,
         size=10,
         from_=0,
-        course_id=None):
-    """ Call the search engine with the appropriate parameters """
+        course_id=None,
+        cursor=None):
+    """
+    Call the search engine with the appropriate parameters
+
+    When cursor is provided, from_ is ignored and the page after the cursor is returned (an empty cursor
+    gives the first page), along with the cursor for the following page within results["cursor"]
+
+    Only the fields of each document which are needed by the result processor and the display of results
+    need be fetched - settings SEARCH_RESULT_SOURCE_INCLUDES and SEARCH_RESULT_SOURCE_EXCLUDES restrict the
+    fields retrieved (see SearchEngine.search source_includes and source_excludes)
+    """
     # field_, filter_ and exclude_dictionary(s) can be overridden by calling application
     # field_dictionary includes course if course_id provided
     (field_dictionary, filter_dictionary, exclude_dictionary) = SearchFilterGenerator.generate_field_filters(
@@ -45,56 +89,76 @@ def perform_search(
     if not searcher:
         raise NoSearchEngineError("No search engine specified in settings.SEARCH_ENGINE")
 
-    results = searcher.search_string(
-        search_term,
+    results = _search_with_cursor(
+        searcher.search_string,
+        cursor,
+        size,
+        from_,
+        query_string=search_term,
         field_dictionary=field_dictionary,
         filter_dictionary=filter_dictionary,
         exclude_dictionary=exclude_dictionary,
-        size=size,
-        from_=from_,
+        source_includes=getattr(settings, "SEARCH_RESULT_SOURCE_INCLUDES", None),
+        source_excludes=getattr(settings, "SEARCH_RESULT_SOURCE_EXCLUDES", None),
         doc_type="courseware_content",
     )
 
-    # post-process the result
+    # post-process the result, dropping those to which access is denied
+    allowed_results = []
     for result in results["results"]:
         result["data"] = SearchResultProcessor.process_result(result["data"], search_term, user)
+        if result["data"] is not None:
+            allowed_results.append(result)
 
-    results["access_denied_count"] = len([r for r in results["results"] if r["data"] is None])
-    results["results"] = [r for r in results["results"] if r["data"] is not None]
+    results["access_denied_count"] = len(results["results"]) - len(allowed_results)
+    results["results"] = allowed_results
 
     return results
 
 
-def course_discovery_search(search_term=None, size=20, from_=0, field_dictionary=None):
+def course_discovery_search(search_term=None, size=20, from_=0, field_dictionary=None, cursor=None):
     """
     Course Discovery activities against the search engine index of course details
+
+    cursor pages through the results as for perform_search
+
+    The values chosen within field_dictionary narrow the results, but (with search engines that support facet
+    selections) each facet's counts are narrowed only by the choices upon the other facets, so that the
+    alternatives within a facet can be offered from the same request
     """
+    searcher = SearchEngine.get_search_engine(getattr(settings, "COURSEWARE_INDEX_NAME", "courseware_index"))
+    if not searcher:
+        raise NoSearchEngineError("No search engine specified in settings.SEARCH_ENGINE")
+
     # We'll ignore the course-enrollemnt informaiton in field and filter
     # dictionary, and use our own logic upon enrollment dates for these
     use_search_fields = ["org"]
     (search_fields, _, exclude_dictionary) = SearchFilterGenerator.generate_field_filters()
     use_field_dictionary = {}
     use_field_dictionary.update({field: search_fields[field] for field in search_fields if field in use_search_fields})
-    if field_dictionary:
+    search_kwargs = {}
+    if searcher.supports_facet_selection:
+        # only the user's choices are facet selections - the generator's restrictions narrow the facet counts too
+        search_kwargs["facet_selection_dictionary"] = field_dictionary or None
+    elif field_dictionary:
         use_field_dictionary.update(field_dictionary)
     if not getattr(settings, "SEARCH_SKIP_ENROLLMENT_START_DATE_FILTERING", False):
-        use_field_dictionary["enrollment_start"] = DateRange(None, datetime.utcnow())
-
-    searcher = SearchEngine.get_search_engine(getattr(settings, "COURSEWARE_INDEX_NAME", "courseware_index"))
-    if not searcher:
-        raise NoSearchEngineError("No search engine specified in settings.SEARCH_ENGINE")
+        use_field_dictionary["enrollment_start"] = DateRange(None, _utcnow_to_the_minute())
 
-    results = searcher.search(
+    results = _search_with_cursor(
+        searcher.search,
+        cursor,
+        size,
+        from_,
         query_string=search_term,
         doc_type="course_info",
-        size=size,
-        from_=from_,
         # only show when enrollment start IS provided and is before now
         field_dictionary=use_field_dictionary,
         # show if no enrollment end is provided and has not yet been reached
-        filter_dictionary={"enrollment_end": DateRange(datetime.utcnow(), None)},
+        filter_dictionary={"enrollment_end": DateRange(_utcnow_to_the_minute(), None)},
         exclude_dictionary=exclude_dictionary,
         facet_terms=course_discovery_facets(),
+        **search_kwargs
     )
 
     return results
@@ -0,0 +1 @@
+""" Micro-benchmarks for the hot paths of searching - each module may be run with python -m """
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark of the JSON serializers available for settings.SEARCH_JSON_SERIALIZER
+
+    python -m search.benchmarks.json_serializers [hit_count] [repeat]
+
+Times decoding an elasticsearch response and encoding the search results for the browser with each
+implementation, alongside the Elasticsearch client's own serializer
+"""
+from datetime import datetime
+import json
+import sys
+from timeit import default_timer
+
+from django.core.exceptions import ImproperlyConfigured
+from elasticsearch.serializer import JSONSerializer as ElasticsearchJSONSerializer
+
+from search.benchmarks.translate_hits import build_response
+from search.elastic import _translate_hits
+from search.serializers import JSONSerializer, SimpleJSONSerializer
+
+
+def time_operation(operation, value, repeat):
+    """ seconds taken to perform the operation upon the value repeat times """
+    start = default_timer()
+    for _ in range(repeat):
+        operation(value)
+    return default_timer() - start
+
+
+def main(hit_count=100, repeat=500):
+    """ run the benchmark, reporting the time per response for each serializer """
+    serialized_response = build_response(hit_count)
+    results = _translate_hits(json.loads(serialized_response))
+    for result in results["results"]:
+        # as parsed from the document by the engine, and in need of the serializer's date handling
+        result["data"]["start_date"] = datetime(2015, 1, 1)
+
+    for serializer_class in [ElasticsearchJSONSerializer, JSONSerializer, SimpleJSONSerializer]:
+        try:
+            serializer = serializer_class()
+        except ImproperlyConfigured as ex:
+            print("{:>45}: skipped - {}".format(serializer_class.__name__, ex))
+            continue
+        loads_elapsed = time_operation(serializer.loads, serialized_response, repeat)
+        dumps_elapsed = time_operation(serializer.dumps, results, repeat)
+        print("{:>45}: loads {:8.1f} dumps {:8.1f} microseconds per {} hit response".format(
+            "{}.{}".format(serializer_class.__module__, serializer_class.__name__),
+            loads_elapsed * 1000000 / repeat,
+            dumps_elapsed * 1000000 / repeat,
+            hit_count
+        ))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,145 @@
+"""
+Benchmark of the latency of course discovery and in-course queries against an elasticsearch cluster
+
+    DJANGO_SETTINGS_MODULE=... python -m search.benchmarks.query_filters [document_count] [repeat]
+
+The settings must configure ELASTIC_SEARCH_CONFIG for the cluster to use. Synthetic documents are
+loaded into a scratch index, which is deleted afterwards. Each query is timed as built by
+_build_search_body (bool query with filters in filter context), and in the earlier form using the
+filtered query with or / not / missing filters, for clusters which still accept that form
+"""
+from datetime import datetime, timedelta
+import random
+import sys
+from timeit import default_timer
+
+from elasticsearch import exceptions
+
+from search.elastic import ElasticSearchEngine, _build_search_body
+from search.utils import DateRange
+
+BENCHMARK_INDEX_NAME = "search_benchmark_query_filters"
+ORGS = ["edX", "MITx", "HarvardX", "BerkeleyX", "DelftX"]
+MODES = ["honor", "verified", "audit", "professional"]
+LANGUAGES = ["en", "fr", "es", "zh"]
+
+
+def _legacy_filter(clause):
+    """ express the filter as the deprecated or / missing filters """
+    if "bool" in clause:
+        bool_clause = clause["bool"]
+        if "should" in bool_clause:
+            return {"or": [_legacy_filter(should_clause) for should_clause in bool_clause["should"]]}
+        if "must_not" in bool_clause and "exists" in bool_clause["must_not"][0]:
+            return {"missing": bool_clause["must_not"][0]["exists"]}
+    return clause
+
+
+def legacy_search_body(body):
+    """ express the search body in the earlier form, as a filtered query """
+    bool_query = body["query"]["bool"]
+    filters = [_legacy_filter(clause) for clause in bool_query.get("filter", [])]
+    if bool_query.get("must_not"):
+        filters.append({"not": {"filter": {"or": bool_query["must_not"]}}})
+
+    legacy_body = dict(body)
+    legacy_body["query"] = {
+        "filtered": {
+            "query": {"bool": {"must": bool_query["must"]}},
+            "filter": {"bool": {"must": filters}},
+        }
+    }
+    return legacy_body
+
+
+def load_documents(engine, document_count):
+    """ index synthetic course and courseware documents """
+    now = datetime.utcnow()
+    courses = [
+        {
+            "id": "course_{}".format(index),
+            "org": random.choice(ORGS),
+            "modes": random.sample(MODES, random.randint(1, 3)),
+            "language": random.choice(LANGUAGES),
+            "enrollment_start": now - timedelta(days=random.randint(-30, 365)),
+            "enrollment_end": now + timedelta(days=random.randint(-30, 365)),
+            "content": {"overview": "course about topic {}".format(index % 50)},
+        }
+        for index in range(document_count)
+    ]
+    engine.index("course_info", courses)
+    engine.index("courseware_content", [
+        {
+            "id": "block_{}".format(index),
+            "course": "course_{}".format(index % 100),
+            "start_date": now - timedelta(days=random.randint(-30, 365)),
+            "content_groups": [random.randint(1, 5)] if index % 3 else None,
+            "content": {"display_name": "Unit {}".format(index), "text": "lesson about topic {}".format(index % 50)},
+        }
+        for index in range(document_count * 10)
+    ])
+    engine._es.indices.refresh(index=engine.index_name)  # pylint: disable=protected-access
+
+
+def benchmark_queries():
+    """ the discovery and in-course searches, as the api builds them """
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    return [
+        ("discovery", "course_info", _build_search_body(
+            field_dictionary={"enrollment_start": DateRange(None, now)},
+            filter_dictionary={"enrollment_end": DateRange(now, None)},
+            facet_terms={"org": {}, "modes": {}, "language": {}},
+            facet_selection_dictionary={"org": "edX"},
+        )),
+        ("in-course", "courseware_content", _build_search_body(
+            query_string="topic 7",
+            field_dictionary={"course": "course_7"},
+            filter_dictionary={"start_date": DateRange(None, now), "content_groups": None},
+            exclude_dictionary={"id": ["block_7", "block_107"]},
+        )),
+    ]
+
+
+def time_query(engine, doc_type, body, repeat):
+    """ the wall clock and elasticsearch reported milliseconds for each of repeat runs of the query """
+    timings = []
+    for _ in range(repeat):
+        start = default_timer()
+        response = engine._es.search(  # pylint: disable=protected-access
+            index=engine.index_name, doc_type=doc_type, body=body, size=20
+        )
+        timings.append(((default_timer() - start) * 1000, response["took"]))
+    return timings
+
+
+def percentile(values, fraction):
+    """ the value at the fraction of the way through the sorted values """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main(document_count=10000, repeat=200):
+    """ run the benchmark, reporting the median and 95th percentile latency of each query """
+    engine = ElasticSearchEngine(BENCHMARK_INDEX_NAME)
+    try:
+        load_documents(engine, document_count)
+        for name, doc_type, body in benchmark_queries():
+            for form, form_body in [("bool filter", body), ("filtered", legacy_search_body(body))]:
+                try:
+                    timings = time_query(engine, doc_type, form_body, repeat)
+                except exceptions.RequestError as ex:
+                    print("{:>10} {:>12}: not supported by this cluster - {}".format(name, form, ex.error))
+                    continue
+                wall_times = [wall_time for wall_time, _ in timings]
+                took_times = [took for _, took in timings]
+                print("{:>10} {:>12}: median {:7.2f} p95 {:7.2f} ms wall, median {} p95 {} ms took".format(
+                    name, form,
+                    percentile(wall_times, 0.5), percentile(wall_times, 0.95),
+                    percentile(took_times, 0.5), percentile(took_times, 0.95),
+                ))
+    finally:
+        engine._es.indices.delete(index=BENCHMARK_INDEX_NAME, ignore=[404])  # pylint: disable=protected-access
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark of the translation of elasticsearch responses into search results
+
+    python -m search.benchmarks.translate_hits [hit_count] [repeat]
+
+Compares _translate_hits against the earlier implementation that copied each hit into a new result
+"""
+import copy
+import json
+import sys
+from timeit import default_timer
+
+from search.elastic import _translate_hits
+
+
+def _copying_translate_hits(es_response):
+    """ the earlier implementation, which copied each hit before translating it """
+    def translate_result(result):
+        """ copy the hit into a new result """
+        translated_result = copy.copy(result)
+        data = translated_result.pop("_source")
+        translated_result.update({
+            "data": data,
+            "score": translated_result["_score"]
+        })
+        return translated_result
+
+    return {
+        "took": es_response["took"],
+        "total": es_response["hits"]["total"],
+        "max_score": es_response["hits"]["max_score"],
+        "results": [translate_result(hit) for hit in es_response["hits"]["hits"]],
+    }
+
+
+def build_response(hit_count):
+    """ a search response with hit_count hits, each with a sizeable document, serialized as elasticsearch sends it """
+    return json.dumps({
+        "took": 5,
+        "timed_out": False,
+        "hits": {
+            "total": hit_count * 10,
+            "max_score": 2.5,
+            "hits": [
+                {
+                    "_index": "courseware_index",
+                    "_type": "courseware_content",
+                    "_id": "block_{}".format(index),
+                    "_score": 2.5 - index / 100.0,
+                    "_source": {
+                        "id": "block_{}".format(index),
+                        "course": "edX/DemoX/Demo_Course",
+                        "location": ["Week {}".format(index), "Lesson", "Unit"],
+                        "start_date": "2015-01-01T00:00:00+00:00",
+                        "content": {
+                            "display_name": "Unit {}".format(index),
+                            "text": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 100,
+                        },
+                    },
+                }
+                for index in range(hit_count)
+            ],
+        },
+    })
+
+
+def time_translation(translate, serialized_response, repeat):
+    """ seconds taken to translate repeat freshly decoded copies of the response """
+    responses = [json.loads(serialized_response) for _ in range(repeat)]
+    start = default_timer()
+    for response in responses:
+        translate(response)
+    return default_timer() - start
+
+
+def main(hit_count=100, repeat=2000):
+    """ run the benchmark, reporting the time per translated response """
+    serialized_response = build_response(hit_count)
+    for name, translate in [("copying", _copying_translate_hits), ("in place", _translate_hits)]:
+        elapsed = time_translation(translate, serialized_response, repeat)
+        print("{:>10}: {:8.1f} microseconds per {} hit response".format(name, elapsed * 1000000 / repeat, hit_count))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
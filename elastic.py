@@ -1,14 +1,28 @@
 """ Elatic Search implementation for courseware search index """
+from collections import OrderedDict
 import copy
+from datetime import date
+import errno
+import hashlib
+import json
 import logging
+from multiprocessing.pool import ThreadPool
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
 
 from django.conf import settings
 from django.core.cache import cache
 from elasticsearch import Elasticsearch, exceptions
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import bulk, scan as scan_hits, streaming_bulk
 
+from search.partitioning import IndexPartitioner
 from search.search_engine_base import SearchEngine
-from search.utils import ValueRange, _is_iterable
+from search.serializers import get_json_serializer
+from search.utils import LRUCache, ValueRange, ProcessRegistry, SingleFlight, _is_iterable
 
 # log appears to be standard name used for logger
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
@@ -19,32 +33,197 @@ log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 # we can safely remove them from analysed matches
 RESERVED_CHARACTERS = "+-=><!(){}[]^\"~*:\\/&|?"
 
+# sort order used when paging with search_after - id breaks ties between equal scores so that every hit has a
+# distinct position to resume after
+SEARCH_AFTER_SORT = [{"_score": "desc"}, {"id": "asc"}]
 
-def _translate_hits(es_response):
-    """ Provide resultset in our desired format from elasticsearch results """
+# Elasticsearch clients hold their own pool of keep-alive connections, so we share
+# one client per configuration across all engines in the process
+_CLIENTS = ProcessRegistry()
 
-    def translate_result(result):
-        """ Any conversion from ES result syntax into our search engine syntax """
-        translated_result = copy.copy(result)
-        data = translated_result.pop("_source")
 
-        translated_result.update({
-            "data": data,
-            "score": translated_result["_score"]
-        })
+def _get_elasticsearch_client():
+    """
+    Return the shared Elasticsearch client for the configuration in settings - when settings.SEARCH_JSON_SERIALIZER
+    is provided, the client uses that serializer in place of its own, and when settings.ELASTIC_SEARCH_HTTP_COMPRESS
+    is set, request bodies are gzip compressed and compressed responses are asked for
+    """
+    es_config = getattr(settings, "ELASTIC_SEARCH_CONFIG", [{}])
+    es_impl = getattr(settings, "ELASTIC_SEARCH_IMPL", Elasticsearch)
+    serializer_class = getattr(settings, "SEARCH_JSON_SERIALIZER", None)
+    http_compress = getattr(settings, "ELASTIC_SEARCH_HTTP_COMPRESS", False)
+    client_kwargs = {}
+    if serializer_class:
+        client_kwargs["serializer"] = get_json_serializer()
+    if http_compress:
+        client_kwargs["http_compress"] = True
+    return _CLIENTS.get_or_create(
+        (es_impl, repr(es_config), serializer_class, http_compress),
+        lambda: es_impl(es_config, **client_kwargs)
+    )
+
+
+# Mappings are also held within each process (when so configured) in front of the django cache
+_LOCAL_MAPPINGS = ProcessRegistry()
+
+
+def _get_local_mappings():
+    """ Return the in-process mappings cache for the configured size and timeout, None if not configured """
+    timeout = getattr(settings, "ELASTIC_SEARCH_MAPPINGS_LOCAL_TIMEOUT", 0)
+    if not timeout:
+        return None
+    max_size = getattr(settings, "ELASTIC_SEARCH_MAPPINGS_LOCAL_SIZE", 100)
+    return _LOCAL_MAPPINGS.get_or_create((max_size, timeout), lambda: LRUCache(max_size, timeout))
+
+
+def _get_local_mappings_versions():
+    """
+    Return the in-process record of the shared mappings version of each index, held for
+    settings.ELASTIC_SEARCH_MAPPINGS_VERSION_INTERVAL seconds (default 1) - None if mappings are not held locally
+    """
+    if not getattr(settings, "ELASTIC_SEARCH_MAPPINGS_LOCAL_TIMEOUT", 0):
+        return None
+    max_size = getattr(settings, "ELASTIC_SEARCH_MAPPINGS_LOCAL_SIZE", 100)
+    interval = getattr(settings, "ELASTIC_SEARCH_MAPPINGS_VERSION_INTERVAL", 1)
+    return _LOCAL_MAPPINGS.get_or_create(("versions", max_size, interval), lambda: LRUCache(max_size, interval))
+
+
+def _get_shared_counter(cache_item_name):
+    """ Current value of a counter within the django cache, starting one if there is none """
+    value = cache.get(cache_item_name)
+    if value is None:
+        # start from the time rather than zero, so that a counter evicted from the cache
+        # cannot come back around to a value which is still remembered elsewhere
+        cache.add(cache_item_name, int(time.time() * 1000), None)
+        value = cache.get(cache_item_name)
+    return value
+
+
+def _bump_shared_counter(cache_item_name):
+    """ Move a counter within the django cache on to its next value """
+    try:
+        cache.incr(cache_item_name)
+    except ValueError:
+        # not present - the next read will start it afresh
+        pass
 
-        return translated_result
+
+# Identical searches in flight at the same time within the process are sent to elasticsearch only once
+_SEARCH_FLIGHTS = ProcessRegistry()
+
+# How often a process waiting for another's identical search checks whether it may go ahead, in seconds
+INTERPROCESS_LOCK_POLL_INTERVAL = 0.05
+
+
+def _get_search_flights():
+    """ Return the process' coalescer of identical searches """
+    return _SEARCH_FLIGHTS.get_or_create("search", SingleFlight)
+
+
+def _try_flock(lock_file, deadline):
+    """ Take an exclusive lock upon the file, trying until the deadline - returns whether the lock was taken """
+    import fcntl  # only available upon posix platforms, so only imported when configured to be used
+
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except IOError as ex:
+            if ex.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+        if time.time() >= deadline:
+            return False
+        time.sleep(INTERPROCESS_LOCK_POLL_INTERVAL)
+
+
+@contextmanager
+def _interprocess_lock(lock_dir, name, timeout):
+    """
+    Exclusive lock shared by the processes upon this host for the given name, waited upon for up to timeout
+    seconds - yields whether the lock was taken. Each name has a lock file of its own, which its holder removes
+    upon release so that the lock directory does not grow without bound
+    """
+    import fcntl  # only available upon posix platforms, so only imported when configured to be used
+
+    lock_path = os.path.join(lock_dir, "elastic_search_{}.lock".format(hashlib.md5(name).hexdigest()))
+    deadline = time.time() + timeout
+    while True:
+        lock_file = open(lock_path, "a")
+        if not _try_flock(lock_file, deadline):
+            lock_file.close()
+            yield False
+            return
+        # the previous holder removes the file upon release, in which case the lock we hold is on a file that
+        # nobody else will ever open - so start again with the file now at the path
+        try:
+            current = os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino
+        except OSError:
+            current = False
+        if current:
+            break
+        lock_file.close()
+
+    try:
+        yield True
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def _search_key_default(value):
+    """ json serialization for the search argument values that json cannot serialize natively """
+    if isinstance(value, ValueRange):
+        return {"lower": value.lower, "upper": value.upper}
+    # values are kept exact - callers building ranges upon the current time round it (see
+    # utils._utcnow_to_the_minute) so that their searches repeat
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError("{!r} is not serializable within a search cache key".format(value))
+
+
+def _normalize_search_arguments(search_arguments):
+    """ Produce a stable digest of the search arguments, regardless of dictionary ordering """
+    normalized = json.dumps(search_arguments, sort_keys=True, default=_search_key_default)
+    return hashlib.md5(normalized).hexdigest()
+
+
+def _translate_result(result):
+    """
+    Any conversion from ES result syntax into our search engine syntax - the hit is converted in place,
+    since the decoded response is ours alone, rather than copying what may be a sizeable document
+    """
+    # no _source is returned when source filtering leaves nothing of the document
+    result["data"] = result.pop("_source", {})
+    result["score"] = result["_score"]
+    return result
+
+
+def _translate_hits(es_response):
+    """ Provide resultset in our desired format from elasticsearch results """
 
     def translate_facet(result):
-        """ Any conversion from ES facet syntax into our search engine sytax """
-        terms = {term["term"]: term["count"] for term in result["terms"]}
+        """ Any conversion from ES terms aggregation syntax into our search engine facet sytax """
+        # facets narrowed by the selections upon other facets hold their terms within a filter aggregation
+        if "buckets" not in result:
+            result = result["terms"]
+        terms = {bucket["key"]: bucket["doc_count"] for bucket in result["buckets"]}
+        other = result.get("sum_other_doc_count", 0)
         return {
             "terms": terms,
-            "total": result["total"],
-            "other": result["other"],
+            "total": sum(terms.values()) + other,
+            "other": other,
         }
 
-    results = [translate_result(hit) for hit in es_response["hits"]["hits"]]
+    results = es_response["hits"]["hits"]
+    for hit in results:
+        _translate_result(hit)
+
     response = {
         "took": es_response["took"],
         "total": es_response["hits"]["total"],
@@ -52,8 +231,10 @@ def _translate_hits(es_response):
         "results": results,
     }
 
-    if "facets" in es_response:
-        response["facets"] = {facet: translate_facet(es_response["facets"][facet]) for facet in es_response["facets"]}
+    if "aggregations" in es_response:
+        response["facets"] = {
+            facet: translate_facet(es_response["aggregations"][facet]) for facet in es_response["aggregations"]
+        }
 
     return response
 
@@ -75,7 +256,8 @@ def _get_filter_field(field_name, field_value):
     elif _is_iterable(field_value):
         filter_field = {
             "terms": {
-                field_name: field_value
+                # in a consistent order, so that the same values make the same filter for the query cache
+                field_name: sorted(field_value)
             }
         }
     else:
@@ -87,6 +269,21 @@ def _get_filter_field(field_name, field_value):
     return filter_field
 
 
+def _missing_filter(field_name):
+    """ Filter for documents which have no value for the field """
+    return {
+        "bool": {
+            "must_not": [
+                {
+                    "exists": {
+                        "field": field_name
+                    }
+                }
+            ]
+        }
+    }
+
+
 def _process_field_queries(field_dictionary):
     """
     We have a field_dictionary - we want to match the values for an elasticsearch "match" query
@@ -100,14 +297,14 @@ def _process_field_queries(field_dictionary):
             }
         }
 
-    return [field_item(field) for field in field_dictionary]
+    return [field_item(field) for field in sorted(field_dictionary)]
 
 
 def _process_field_filters(field_dictionary):
     """
     We have a field_dictionary - we match the values using a "term" filter in elasticsearch
     """
-    return [_get_filter_field(field, field_value) for field, field_value in field_dictionary.items()]
+    return [_get_filter_field(field, field_dictionary[field]) for field in sorted(field_dictionary)]
 
 
 def _process_filters(filter_dictionary):
@@ -120,72 +317,442 @@ def _process_filters(filter_dictionary):
         """ format elasticsearch filter to pass if value matches OR field is not included """
         if filter_dictionary[field] is not None:
             return {
-                "or": [
-                    _get_filter_field(field, filter_dictionary[field]),
-                    {
-                        "missing": {
-                            "field": field
-                        }
-                    }
-                ]
-            }
-        else:
-            return {
-                "missing": {
-                    "field": field
+                "bool": {
+                    "should": [
+                        _get_filter_field(field, filter_dictionary[field]),
+                        _missing_filter(field)
+                    ],
+                    "minimum_should_match": 1
                 }
             }
+        else:
+            return _missing_filter(field)
 
-    return [filter_item(field) for field in filter_dictionary]
+    return [filter_item(field) for field in sorted(filter_dictionary)]
 
 
 def _process_exclude_dictionary(exclude_dictionary):
     """
-    Based on values in the exclude_dictionary generate a list of term queries that
-    will filter out unwanted results.
+    Based on values in the exclude_dictionary generate a list of terms filters, for
+    the bool must_not clause, that will filter out unwanted results.
     """
-    # not_properties will hold the generated term queries.
     not_properties = []
-    for exclude_property in exclude_dictionary:
+    for exclude_property in sorted(exclude_dictionary):
         exclude_values = exclude_dictionary[exclude_property]
         if not isinstance(exclude_values, list):
             exclude_values = [exclude_values]
-        not_properties.extend([{"term": {exclude_property: exclude_value}} for exclude_value in exclude_values])
+        # an empty list excludes nothing
+        if exclude_values:
+            not_properties.append({"terms": {exclude_property: sorted(exclude_values)}})
 
-    # Returning a query segment with an empty list freaks out ElasticSearch,
-    #   so just return an empty segment.
-    if not not_properties:
-        return {}
+    return not_properties
 
-    return {
-        "not": {
-            "filter": {
-                "or": not_properties
-            }
-        }
-    }
 
+def _process_facet_terms(facet_terms, facet_selection_dictionary=None):
+    """
+    We have a list of terms with which we return facets, each as a terms aggregation
 
-def _process_facet_terms(facet_terms):
-    """ We have a list of terms with which we return facets """
-    elastic_facets = {}
+    When there are facet selections, these are applied as a post_filter to the hits only, so each facet is
+    narrowed by the selections upon the other facets alone - this way the counts for the alternatives to
+    the selected values within a facet are still available from the same request
+    """
+    elastic_aggregations = {}
     for facet in facet_terms:
         facet_term = {"field": facet}
         if facet_terms[facet]:
             for facet_option in facet_terms[facet]:
                 facet_term[facet_option] = facet_terms[facet][facet_option]
 
-        elastic_facets[facet] = {
+        aggregation = {
             "terms": facet_term
         }
+        if facet_selection_dictionary:
+            other_selections = {
+                field: value for field, value in facet_selection_dictionary.items() if field != facet
+            }
+            aggregation = {
+                "filter": _combine_filters(_process_field_filters(other_selections)),
+                "aggs": {
+                    "terms": aggregation
+                }
+            }
+
+        elastic_aggregations[facet] = aggregation
+
+    return elastic_aggregations
+
+
+def _combine_filters(filters):
+    """ Single filter matching when all of the filters match """
+    if not filters:
+        return {"match_all": {}}
+    return {
+        "bool": {
+            "filter": filters
+        }
+    }
+
+
+def _merge_properties(properties, new_properties):
+    """ Merge mapping properties into properties, combining the sub-properties of object fields """
+    for field_name, field_property in new_properties.items():
+        existing_property = properties.get(field_name)
+        if existing_property is None:
+            # copy, because the property may have come straight from settings
+            properties[field_name] = copy.deepcopy(field_property)
+        elif "properties" in existing_property and "properties" in field_property:
+            _merge_properties(existing_property["properties"], field_property["properties"])
+
+
+def _chunk_sources(sources, chunk_size, max_chunk_bytes, serialize):
+    """
+    Consume sources lazily, grouping them into chunks bounded by both the number of documents and their
+    serialized size - yields lists of (source, serialized source) tuples
+    """
+    chunk = []
+    chunk_bytes = 0
+    for source in sources:
+        serialized_source = serialize(source)
+        if chunk and (len(chunk) >= chunk_size or chunk_bytes + len(serialized_source) > max_chunk_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append((source, serialized_source))
+        chunk_bytes += len(serialized_source)
+
+    if chunk:
+        yield chunk
+
+
+class BulkRetryPolicy(object):
+
+    """
+    Decides how bulk actions that elasticsearch rejects because it is too busy (status 429) get retried
+
+    Rejected actions are retried after an exponential backoff with full jitter. Retries are drawn from a budget
+    which successfully indexed actions replenish, so that retries stay in proportion to the work getting done;
+    all bulk requests are also delayed in proportion to the recent rate of rejections, so that the pace of
+    indexing falls while the cluster is struggling. The rejection rate decays with time as well as with successful
+    requests, so that a burst of rejections does not slow down indexing long after the cluster has recovered.
+    Counters of retries and give-ups are kept for monitoring.
+    """
+
+    # The proportion of a retry earned by each successfully indexed action
+    BUDGET_RATIO = 0.5
+
+    # Weight given to the latest request when updating the rejection rate
+    REJECTION_RATE_WEIGHT = 0.2
+
+    # Seconds over which the rejection rate halves when no requests are made
+    REJECTION_RATE_HALF_LIFE = 10.0
+
+    def __init__(self, max_retries, initial_backoff, max_backoff, budget):
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.budget_capacity = budget
+        self.budget = float(budget)
+        self.retries = 0
+        self.give_ups = 0
+        self._rejection_rate = 0.0
+        self._rejection_rate_time = time.time()
+        self._lock = threading.Lock()
+
+    def _decayed_rejection_rate(self, now):
+        """ the rejection rate, decayed for the time since it was last updated - call holding _lock """
+        elapsed = max(0, now - self._rejection_rate_time)
+        return self._rejection_rate * 0.5 ** (elapsed / self.REJECTION_RATE_HALF_LIFE)
+
+    @property
+    def rejection_rate(self):
+        """ the recent proportion of actions rejected by elasticsearch """
+        with self._lock:
+            return self._decayed_rejection_rate(time.time())
+
+    def throttle(self):
+        """ pause ahead of a bulk request, in proportion to the recent rejection rate """
+        delay = self.max_backoff * self.rejection_rate
+        if delay > 0:
+            time.sleep(delay)
+
+    def backoff(self, attempt):
+        """ pause ahead of retrying rejected actions for the attempt'th time """
+        time.sleep(random.uniform(0, min(self.max_backoff, self.initial_backoff * 2 ** attempt)))
+
+    def record(self, action_count, rejected_count):
+        """ update the rejection rate and budget from the outcome of a bulk request """
+        with self._lock:
+            now = time.time()
+            self._rejection_rate = (
+                (1 - self.REJECTION_RATE_WEIGHT) * self._decayed_rejection_rate(now) +
+                self.REJECTION_RATE_WEIGHT * float(rejected_count) / action_count
+            )
+            self._rejection_rate_time = now
+            self.budget = min(
+                self.budget_capacity,
+                self.budget + (action_count - rejected_count) * self.BUDGET_RATIO
+            )
+
+    def take_retries(self, rejected_count, attempt):
+        """ returns how many of the rejected actions may be retried - the others are given up upon """
+        with self._lock:
+            allowed = 0 if attempt >= self.max_retries else min(rejected_count, int(self.budget))
+            self.budget -= allowed
+            self.retries += allowed
+            self.give_ups += rejected_count - allowed
+            return allowed
+
+    def counters(self):
+        """ monitoring information about retries """
+        return {
+            "retries": self.retries,
+            "give_ups": self.give_ups,
+            "rejection_rate": self.rejection_rate,
+        }
+
+
+# The bulk loads in progress within the process, by index - with how many are active and the settings to restore
+_BULK_LOADS = {}
+_BULK_LOADS_LOCK = threading.Lock()
+
+
+# Retry state is shared by all bulk requests made by the process
+_RETRY_POLICIES = ProcessRegistry()
+
+
+def _get_bulk_retry_policy():
+    """ Return the process' policy for retrying rejected bulk actions, None if retries are not configured """
+    max_retries = getattr(settings, "ELASTIC_SEARCH_BULK_MAX_RETRIES", 0)
+    if not max_retries:
+        return None
+    policy_settings = (
+        max_retries,
+        getattr(settings, "ELASTIC_SEARCH_BULK_INITIAL_BACKOFF", 2),
+        getattr(settings, "ELASTIC_SEARCH_BULK_MAX_BACKOFF", 60),
+        getattr(settings, "ELASTIC_SEARCH_BULK_RETRY_BUDGET", 1000),
+    )
+    return _RETRY_POLICIES.get_or_create(policy_settings, lambda: BulkRetryPolicy(*policy_settings))
+
+
+def _bulk_item_status(item):
+    """ the http status for a single item of a bulk response, which is keyed by its operation type """
+    return list(item.values())[0].get("status")
+
+
+def _rejected_request_item(action, ex):
+    """ bulk response item for an action which was not performed, because its whole request was rejected """
+    return {
+        action.get("_op_type", "index"): {
+            "_index": action.get("_index"),
+            "_type": action.get("_type"),
+            "_id": action.get("_id"),
+            "status": ex.status_code,
+            "error": ex.error,
+        }
+    }
+
+
+def _bulk_with_retry(client, actions, **kwargs):
+    """
+    Send the actions with bulk, retrying those rejected because the cluster is busy according to the
+    BulkRetryPolicy when ELASTIC_SEARCH_BULK_MAX_RETRIES is set - whether elasticsearch rejects individual
+    actions, or a whole bulk request. Returns the number of successful actions and the errors, like bulk does;
+    actions given up upon are included within the errors
+    """
+    policy = _get_bulk_retry_policy()
+    if policy is None:
+        return bulk(client, actions, **kwargs)
+
+    # we need to see the outcome of each action, rather than have the first error raised
+    kwargs.pop("raise_on_error", None)
+    actions = list(actions)
+    success_count = 0
+    errors = []
+    attempt = 0
+    while actions:
+        policy.throttle()
+        rejected = []
+        outcomes = streaming_bulk(client, actions, raise_on_error=False, **kwargs)
+        processed_count = 0
+        try:
+            # outcomes are read one at a time, so that those before a rejected request are counted only once
+            for index, (succeeded, item) in enumerate(outcomes):
+                action = actions[index]
+                processed_count += 1
+                if succeeded:
+                    success_count += 1
+                elif _bulk_item_status(item) == 429:
+                    rejected.append((action, item))
+                else:
+                    errors.append(item)
+        except exceptions.TransportError as ex:
+            if ex.status_code != 429:
+                raise
+            # the request for a chunk was turned away as a whole, so none of the actions from there on were performed
+            rejected.extend((action, _rejected_request_item(action, ex)) for action in actions[processed_count:])
+
+        policy.record(len(actions), len(rejected))
+        allowed = policy.take_retries(len(rejected), attempt)
+        errors.extend([item for _, item in rejected[allowed:]])
+        actions = [action for action, _ in rejected[:allowed]]
+        if actions:
+            log.warning("retrying %d bulk actions rejected by elasticsearch", len(actions))
+            policy.backoff(attempt)
+            attempt += 1
+
+    return success_count, errors
+
+
+def _parallel_bulk(client, chunks, thread_count, queue_size, **kwargs):
+    """
+    Send each chunk of actions with bulk upon a pool of thread_count threads, with no more than queue_size
+    chunks waiting for a thread at any time. Returns the total number of successful actions and the errors
+    across all chunks, like bulk does; an exception from any chunk is raised once all chunks are complete
+    """
+    pool = ThreadPool(thread_count)
+    slots = threading.BoundedSemaphore(thread_count + queue_size)
+    outcomes = []
+
+    def send_chunk(chunk):
+        """ send the chunk, freeing its slot for the next chunk to be queued """
+        try:
+            return _bulk_with_retry(client, chunk, chunk_size=len(chunk), **kwargs)
+        finally:
+            slots.release()
+
+    try:
+        for chunk in chunks:
+            slots.acquire()
+            outcomes.append(pool.apply_async(send_chunk, (chunk,)))
+    finally:
+        pool.close()
+        pool.join()
+
+    success_count = 0
+    errors = []
+    for outcome in outcomes:
+        chunk_success_count, chunk_errors = outcome.get()
+        success_count += chunk_success_count
+        errors.extend(chunk_errors)
+    return success_count, errors
+
+
+# The arguments of search from which the request body is built, with their defaults - any other arguments
+# are parameters of the search request itself, which are passed through to elasticsearch
+SEARCH_BODY_ARGUMENTS = OrderedDict([
+    ("query_string", None),
+    ("field_dictionary", None),
+    ("filter_dictionary", None),
+    ("exclude_dictionary", None),
+    ("facet_terms", None),
+    ("exclude_ids", None),
+    ("use_field_match", False),
+    ("search_after", None),
+    ("source_includes", None),
+    ("source_excludes", None),
+    ("facet_selection_dictionary", None),
+])
+
+# Search request parameters which elasticsearch only accepts within the body of each search of a multi search,
+# with the name each takes there - others go within the header of the search
+MSEARCH_BODY_PARAMETERS = {
+    "size": "size",
+    "from_": "from",
+    "timeout": "timeout",
+    "terminate_after": "terminate_after",
+}
+
+
+def _build_search_body(query_string=None,
+                       field_dictionary=None,
+                       filter_dictionary=None,
+                       exclude_dictionary=None,
+                       facet_terms=None,
+                       exclude_ids=None,
+                       use_field_match=False,
+                       search_after=None,
+                       source_includes=None,
+                       source_excludes=None,
+                       facet_selection_dictionary=None):  # pylint: disable=too-many-arguments, too-many-branches
+    """
+    Build the elasticsearch request body for the search arguments - see ElasticSearchEngine.search
+    for a description of each argument
+    """
+    elastic_queries = []
+    elastic_filters = []
+    elastic_exclusions = []
+
+    # We have a query string, search all fields for matching text within the "content" node
+    if query_string:
+        elastic_queries.append({
+            "query_string": {
+                "fields": ["content.*"],
+                "query": query_string.encode('utf-8').translate(None, RESERVED_CHARACTERS)
+            }
+        })
+
+    if field_dictionary:
+        if use_field_match:
+            elastic_queries.extend(_process_field_queries(field_dictionary))
+        else:
+            elastic_filters.extend(_process_field_filters(field_dictionary))
+
+    if filter_dictionary:
+        elastic_filters.extend(_process_filters(filter_dictionary))
+
+    # Support deprecated argument of exclude_ids
+    if exclude_ids:
+        if not exclude_dictionary:
+            exclude_dictionary = {}
+        if "_id" not in exclude_dictionary:
+            exclude_dictionary["_id"] = []
+        exclude_dictionary["_id"].extend(exclude_ids)
+
+    if exclude_dictionary:
+        elastic_exclusions.extend(_process_exclude_dictionary(exclude_dictionary))
+
+    # Only the queries contribute to scoring; the filters and exclusions are in filter context, so that
+    # elasticsearch can cache them - each is built in a consistent order so that the cache is reused
+    query = {
+        "bool": {
+            "must": elastic_queries or [{"match_all": {}}]
+        }
+    }
+    if elastic_filters:
+        query["bool"]["filter"] = elastic_filters
+    if elastic_exclusions:
+        query["bool"]["must_not"] = elastic_exclusions
+
+    body = {"query": query}
+    if facet_terms:
+        facet_query = _process_facet_terms(facet_terms, facet_selection_dictionary)
+        if facet_query:
+            body["aggs"] = facet_query
+
+    if facet_selection_dictionary:
+        body["post_filter"] = _combine_filters(_process_field_filters(facet_selection_dictionary))
+
+    if search_after is not None:
+        body["sort"] = SEARCH_AFTER_SORT
+        if search_after:
+            body["search_after"] = search_after
+
+    if source_includes or source_excludes:
+        body["_source"] = {}
+        if source_includes:
+            body["_source"]["includes"] = source_includes
+        if source_excludes:
+            body["_source"]["excludes"] = source_excludes
 
-    return elastic_facets
+    return body
 
 
 class ElasticSearchEngine(SearchEngine):
 
     """ ElasticSearch implementation of SearchEngine abstraction """
 
+    supports_facet_selection = True
+
     @staticmethod
     def get_cache_item_name(index_name, doc_type):
         """ name-formatter for cache_item_name """
@@ -194,22 +761,273 @@ class ElasticSearchEngine(SearchEngine):
             doc_type
         )
 
+    @staticmethod
+    def get_mappings_version_cache_item_name(index_name):
+        """ name-formatter for the cache item holding the version of the mappings of the index """
+        return "elastic_search_mappings_version_{}".format(index_name)
+
     @classmethod
     def get_mappings(cls, index_name, doc_type):
-        """ fetch mapped-items structure from cache """
-        return cache.get(cls.get_cache_item_name(index_name, doc_type), {})
+        """
+        fetch mapped-items structure from cache
+
+        If settings.ELASTIC_SEARCH_MAPPINGS_LOCAL_TIMEOUT is set, mappings are held within the process for that
+        many seconds (for up to ELASTIC_SEARCH_MAPPINGS_LOCAL_SIZE doc_types) before the django cache is consulted
+        again. Each is held along with the version of the index's mappings within the django cache, which any
+        process clearing mappings moves on; the version is checked at most every
+        ELASTIC_SEARCH_MAPPINGS_VERSION_INTERVAL seconds (default 1), so mappings cleared elsewhere - e.g. because
+        the index was replaced - are let go of within that time
+        """
+        cache_item_name = cls.get_cache_item_name(index_name, doc_type)
+        local_mappings = _get_local_mappings()
+        if local_mappings is None:
+            return cache.get(cache_item_name, {})
+
+        local_versions = _get_local_mappings_versions()
+        version = local_versions.get(index_name)
+        local_item = local_mappings.get(cache_item_name)
+        if version is not None and local_item is not None and local_item[0] == version:
+            return local_item[1]
+
+        # the version comes along with the mappings, so this costs no more than a lookup of the mappings alone
+        version_cache_item_name = cls.get_mappings_version_cache_item_name(index_name)
+        shared_items = cache.get_many([cache_item_name, version_cache_item_name])
+        version = shared_items.get(version_cache_item_name)
+        if version is None:
+            version = _get_shared_counter(version_cache_item_name)
+        local_versions.set(index_name, version)
+
+        mappings = shared_items.get(cache_item_name, {})
+        # absent mappings are about to be loaded, so there is no point holding on to them
+        if mappings:
+            local_mappings.set(cache_item_name, (version, mappings))
+        return mappings
 
     @classmethod
     def set_mappings(cls, index_name, doc_type, mappings):
         """ set new mapped-items structure into cache """
-        cache.set(cls.get_cache_item_name(index_name, doc_type), mappings)
+        cache_item_name = cls.get_cache_item_name(index_name, doc_type)
+        cache.set(cache_item_name, mappings)
+
+        local_mappings = _get_local_mappings()
+        if local_mappings is not None:
+            if mappings:
+                local_versions = _get_local_mappings_versions()
+                version = local_versions.get(index_name)
+                if version is None:
+                    version = _get_shared_counter(cls.get_mappings_version_cache_item_name(index_name))
+                    local_versions.set(index_name, version)
+                local_mappings.set(cache_item_name, (version, mappings))
+            else:
+                local_mappings.delete(cache_item_name)
+
+    @classmethod
+    def bump_mappings_version(cls, index_name):
+        """ move on to the next version of the index's mappings, so that no process keeps what it holds locally """
+        _bump_shared_counter(cls.get_mappings_version_cache_item_name(index_name))
+        local_versions = _get_local_mappings_versions()
+        if local_versions is not None:
+            local_versions.delete(index_name)
+
+    @staticmethod
+    def get_rebuild_cache_item_name(index_name):
+        """ name-formatter for the cache item naming the new index that reindex is building for the index """
+        return "elastic_search_rebuild_{}".format(index_name)
+
+    @staticmethod
+    def get_generation_cache_item_name(index_name):
+        """ name-formatter for the cache item holding the result generation of the index """
+        return "elastic_search_generation_{}".format(index_name)
+
+    @classmethod
+    def get_result_generation(cls, index_name):
+        """
+        fetch the current result generation for the index - cached search results are only valid for
+        the generation in which they were stored, so changing it invalidates them all at once
+        """
+        return _get_shared_counter(cls.get_generation_cache_item_name(index_name))
+
+    @classmethod
+    def bump_result_generation(cls, index_name):
+        """ move on to the next result generation for the index, so that no cached results are served """
+        _bump_shared_counter(cls.get_generation_cache_item_name(index_name))
+
+    @staticmethod
+    def get_recent_change_cache_item_name(index_name):
+        """ name-formatter for the cache item present while changes to the index may not yet be searchable """
+        return "elastic_search_recent_change_{}".format(index_name)
+
+    @classmethod
+    def get_result_cache_item_name(cls, index_name, search_arguments):
+        """ name-formatter for cached search results """
+        return "elastic_search_results_{}_{}_{}".format(
+            index_name,
+            cls.get_result_generation(index_name),
+            _normalize_search_arguments(search_arguments)
+        )
+
+    @staticmethod
+    def bulk_retry_counters():
+        """ monitoring information about the retrying of rejected bulk actions, None if retries are not configured """
+        policy = _get_bulk_retry_policy()
+        return policy.counters() if policy else None
+
+    @staticmethod
+    def _result_cache_timeout():
+        """ how long search results are cached for, a falsy value disables the cache """
+        return getattr(settings, "ELASTIC_SEARCH_RESULT_CACHE_TIMEOUT", 0)
+
+    @staticmethod
+    def _coalesces_searches():
+        """ whether identical concurrent searches are sent to elasticsearch once """
+        return getattr(settings, "ELASTIC_SEARCH_COALESCE_SEARCHES", False)
+
+    @classmethod
+    def _tracks_result_generation(cls):
+        """
+        whether changes to the index move it on to a new result generation - so that neither cached results nor
+        those of a search in flight from before a change are served to searches made after it
+        """
+        return bool(cls._result_cache_timeout() or cls._coalesces_searches())
+
+    def _record_change(self, refreshed=False):
+        """
+        Note a change to the index, so that neither cached results nor searches in flight from before the change
+        are served to searches made after it - and, unless the change was refreshed along with it, so that no
+        results are cached until elasticsearch has had the time to refresh (see search)
+        """
+        if not self._tracks_result_generation():
+            return
+        if self._result_cache_timeout() and not refreshed:
+            # noted before the generation moves on, so that no search of the new generation can miss it
+            cache.set(
+                ElasticSearchEngine.get_recent_change_cache_item_name(self.index_name),
+                True,
+                getattr(settings, "ELASTIC_SEARCH_RESULT_CACHE_SETTLE_TIME", 2)
+            )
+        ElasticSearchEngine.bump_result_generation(self.index_name)
+
+    @staticmethod
+    def _routing_field():
+        """
+        Field by which documents are routed to shards, None to route by id - all the documents with the same
+        value share a shard, so searches pinned to one value of the field need only visit that shard. Changing
+        settings.ELASTIC_SEARCH_ROUTING_FIELD for an existing index requires it to be rebuilt with reindex()
+        """
+        return getattr(settings, "ELASTIC_SEARCH_ROUTING_FIELD", None)
+
+    @staticmethod
+    def _search_routing(field_dictionary):
+        """ routing for a search, when its field_dictionary pins the routing field to a single value """
+        routing_field = ElasticSearchEngine._routing_field()
+        if not (routing_field and field_dictionary and routing_field in field_dictionary):
+            return {}
+        routing_value = field_dictionary[routing_field]
+        if isinstance(routing_value, ValueRange) or _is_iterable(routing_value):
+            return {}
+        return {"routing": routing_value}
+
+    def _document_locations(self, doc_type, doc_ids, routing=None):
+        """
+        the location of each of the documents that exist, giving the physical _index and any _routing of each
+
+        Documents are fetched by id from each index that may hold them, which finds them as soon as they are
+        indexed - but only with their routing, so documents routed by a value that is not given are searched for
+        instead, which finds them once the index has refreshed
+        """
+        locations = {}
+        if self._routing_field() and routing is None:
+            response = self._es.search(
+                index=self.partitioner.search_indices(),
+                doc_type=doc_type,
+                body={"query": {"ids": {"values": doc_ids}}},
+                size=len(doc_ids),
+                _source=False
+            )
+            locations.update((hit["_id"], hit) for hit in response["hits"]["hits"])
+
+        # documents without routing, or with the routing given
+        lookup_ids = [doc_id for doc_id in doc_ids if doc_id not in locations]
+        if lookup_ids:
+            docs = []
+            for index_name in self.partitioner.index_names():
+                for doc_id in lookup_ids:
+                    doc = {"_index": index_name, "_type": doc_type, "_id": doc_id}
+                    if routing is not None:
+                        doc["_routing"] = routing
+                    docs.append(doc)
+            response = self._es.mget(body={"docs": docs}, _source=False)
+            # partitions that have not been created yet report an error in place of each document
+            for doc in response["docs"]:
+                if doc.get("found"):
+                    locations.setdefault(doc["_id"], doc)
+        return locations
+
+    def _rebuild_engine(self):
+        """ Engine for the new index that reindex, within any process, is building in place of this one - if any """
+        rebuild_index_name = cache.get(ElasticSearchEngine.get_rebuild_cache_item_name(self.index_name))
+        if not rebuild_index_name:
+            return None
+        engine = self._rebuild_engines.get(rebuild_index_name)
+        if engine is None:
+            engine = self.__class__(index=rebuild_index_name)
+            self._rebuild_engines[rebuild_index_name] = engine
+        return engine
+
+    def _apply_to_rebuild(self, operation_name, doc_type, values, **kwargs):
+        """
+        Repeat an index or remove operation upon the index being rebuilt, if any, so that the change is not lost
+        when it is swapped in - problems are logged rather than raised, since the operation itself succeeded
+        """
+        rebuild_engine = self._rebuild_engine()
+        if rebuild_engine is None:
+            return
+        try:
+            getattr(rebuild_engine, operation_name)(doc_type, values, **kwargs)
+        # Broad exception handler, the change has been made upon the live index
+        except Exception:  # pylint: disable=broad-except
+            log.exception(
+                "error while applying %s of %d %s documents to %s, which is being rebuilt",
+                operation_name, len(values), doc_type, rebuild_engine.index_name
+            )
+
+    def _partition_engine(self, index_name):
+        """ engine for one of the physical indices of this partitioned index, which does no partitioning itself """
+        if index_name == self.index_name:
+            return self
+        engine = self._partition_engines.get(index_name)
+        if engine is None:
+            engine = self.__class__(index=index_name)
+            engine.partitioner = IndexPartitioner(index_name)
+            self._partition_engines[index_name] = engine
+        return engine
+
+    def _partition_sources(self, doc_type, items, source_of=None):
+        """
+        Group the items (sources, unless source_of finds the source for each) by the engine for the physical
+        index in which the documents belong - which is this engine alone unless the index is partitioned
+        """
+        if not self.partitioner.is_partitioned:
+            return [(self, items)]
+        partitions = OrderedDict()
+        for item in items:
+            source = item if source_of is None else source_of(item)
+            partitions.setdefault(self.partitioner.document_index(doc_type, source), []).append(item)
+        return [
+            (self._partition_engine(index_name), partition_items)
+            for index_name, partition_items in partitions.items()
+        ]
 
     @classmethod
     def log_indexing_error(cls, indexing_errors):
         """ Logs indexing errors and raises a general ElasticSearch Exception"""
         indexing_errors_log = []
         for indexing_error in indexing_errors:
-            indexing_errors_log.append(indexing_error.message)
+            # errors are either exceptions or, for individual actions, the item from the bulk response
+            if isinstance(indexing_error, Exception):
+                indexing_errors_log.append(indexing_error.message)
+            else:
+                indexing_errors_log.append(json.dumps(indexing_error))
         raise exceptions.ElasticsearchException(', '.join(indexing_errors_log))
 
     def _get_mappings(self, doc_type):
@@ -265,22 +1083,304 @@ class ElasticSearchEngine(SearchEngine):
         return doc_mappings
 
     def _clear_mapping(self, doc_type):
-        """ Remove the cached mappings, so that they get loaded from ES next time they are requested """
+        """
+        Remove the cached mappings, so that they get loaded from ES next time they are requested - by any
+        process, including those holding them locally
+        """
         ElasticSearchEngine.set_mappings(self.index_name, doc_type, {})
+        ElasticSearchEngine.bump_mappings_version(self.index_name)
 
     def __init__(self, index=None):
         super(ElasticSearchEngine, self).__init__(index)
-        es_config = getattr(settings, "ELASTIC_SEARCH_CONFIG", [{}])
-        self._es = getattr(settings, "ELASTIC_SEARCH_IMPL", Elasticsearch)(es_config)
+        self._partition_engines = {}
+        self._rebuild_engines = {}
+        # Engines are shared by SearchEngine.get_search_engine, so this check happens once per process
         if not self._es.indices.exists(index=self.index_name):
             self._es.indices.create(index=self.index_name)
 
-    def _check_mappings(self, doc_type, body):
+    @property
+    def _es(self):
+        """ the shared Elasticsearch client for the current configuration """
+        return _get_elasticsearch_client()
+
+    @contextmanager
+    def bulk_load(self):
+        """
+        Context within which to load large numbers of documents, e.g. for a full reindex:
+
+            with searcher.bulk_load():
+                searcher.index_stream("courseware_content", all_the_content())
+
+        Refreshes and replicas are suspended upon entry; upon exit (whether or not an exception is raised) the
+        original settings are restored, the index is refreshed and we wait (for up to
+        settings.ELASTIC_SEARCH_BULK_LOAD_GREEN_TIMEOUT seconds, default 600) for it to become green again.
+        Loads may be nested, or run concurrently within the process - the settings are restored once the last
+        of them is done. Loads into the same index from separate processes are not coordinated. When the index
+        is partitioned, each of its partitions is loaded in the same way.
+        """
+        indices = self.partitioner.search_indices()
+        with _BULK_LOADS_LOCK:
+            active_load = _BULK_LOADS.get(indices)
+            if active_load is None:
+                active_load = {"count": 0, "original_settings": self._suspend_for_bulk_load(indices)}
+                _BULK_LOADS[indices] = active_load
+            active_load["count"] += 1
+
+        try:
+            yield self
+        finally:
+            with _BULK_LOADS_LOCK:
+                active_load["count"] -= 1
+                finished = active_load["count"] == 0
+                if finished:
+                    del _BULK_LOADS[indices]
+                    # restored while holding the lock, so that a load starting now records the original settings
+                    self._restore_after_bulk_load(indices, active_load["original_settings"])
+            if finished:
+                self._wait_for_green(indices)
+
+    def _suspend_for_bulk_load(self, indices):
+        """ Suspend refreshes and replicas upon the indices, returning the settings of each to be restored """
+        # the index name may be an alias, so remember the settings of each index behind it
+        original_settings = {}
+        index_settings = self._es.indices.get_settings(index=indices, flat_settings=True)
+        for index_name, index_setting in index_settings.items():
+            index_setting = index_setting["settings"]
+            original_settings[index_name] = {
+                "index.refresh_interval": index_setting.get("index.refresh_interval", "1s"),
+                "index.number_of_replicas": index_setting.get("index.number_of_replicas", 1),
+            }
+
+        try:
+            self._es.indices.put_settings(
+                index=",".join(original_settings),
+                body={
+                    "index.refresh_interval": "-1",
+                    "index.number_of_replicas": 0,
+                }
+            )
+        except exceptions.ElasticsearchException:
+            # some of the indices may have been changed before the failure
+            self._restore_after_bulk_load(indices, original_settings)
+            raise
+        return original_settings
+
+    def _restore_after_bulk_load(self, indices, original_settings):
+        """
+        Put back the settings of each index and refresh them - problems are logged rather than raised, so that
+        they neither stop the other indices being restored nor hide an exception from within the load
+        """
+        for index_name, original_setting in original_settings.items():
+            try:
+                self._es.indices.put_settings(index=index_name, body=original_setting)
+            # Broad exception handler, every index must get its turn
+            except Exception:  # pylint: disable=broad-except
+                log.exception("could not restore the settings of index %s after bulk load", index_name)
+        try:
+            self._es.indices.refresh(index=indices)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("could not refresh index %s after bulk load", indices)
+        # the documents loaded only now become searchable, so results cached meanwhile are out of date
+        self._record_change(refreshed=True)
+
+    def _wait_for_green(self, indices):
+        """ Wait for the indices to become green again after a bulk load, logging if they do not """
+        green_timeout = getattr(settings, "ELASTIC_SEARCH_BULK_LOAD_GREEN_TIMEOUT", 600)
+        try:
+            self._es.cluster.health(
+                index=indices,
+                wait_for_status="green",
+                timeout="{}s".format(green_timeout),
+                request_timeout=green_timeout + 10,
+            )
+        except exceptions.TransportError as ex:
+            # do not hide any exception from within the context, the settings are already restored
+            log.warning("index %s did not become green after bulk load - %s", indices, ex)
+
+    def _index_versions(self):
+        """ The versioned indices built by reindex for this index name, as a sorted list of (version, index name) """
+        version_pattern = re.compile(r"^{}_v(\d+)$".format(re.escape(self.index_name)))
+        index_names = self._es.indices.get_settings(index="{}_v*".format(self.index_name)).keys()
+        return sorted(
+            (int(match.group(1)), match.group(0))
+            for match in [version_pattern.match(index_name) for index_name in index_names]
+            if match
+        )
+
+    def reindex(self, populate, warm_searches=None, keep_versions=None):
+        """
+        Rebuild the index without interrupting or degrading searches
+
+        The documents are loaded into a new index named "<index name>_v<n>", which is then warmed and swapped in
+        behind an alias of the index name in a single atomic operation. Older versions beyond the most recent
+        keep_versions (default settings.ELASTIC_SEARCH_REINDEX_KEEP_VERSIONS, or 2 to allow a rollback; at least
+        1) are deleted. When the index is partitioned (see settings.SEARCH_PARTITION_STRATEGY), each version has
+        partitions of its own, named "<index name>_v<n>__<partition>", which are swapped in behind aliases of the
+        partition names within the same operation.
+
+        While populate runs, documents indexed into or removed from the index by any process (sharing the django
+        cache) are indexed into or removed from the new index as well, so that they are not lost at the swap. A
+        document changed this way may still be overwritten by populate, if populate read it before the change
+        and writes it afterward - so populate should read each document as late as it can, or the documents
+        changed during the rebuild be indexed again afterward. The rebuild is expected to take no longer than
+        settings.ELASTIC_SEARCH_REINDEX_TIMEOUT seconds (default 86400), after which writes are no longer doubled.
+
+        Args:
+            populate (callable): called with a search engine for the new index, to index all of the documents
+
+            warm_searches (list): dictionaries of search arguments to be run upon the new index before it is
+            swapped in, so that its caches are warm from the first search
+
+            keep_versions (int): how many versioned indices to keep, including the new one
+
+        Returns:
+            the name of the new index
+        """
+        if keep_versions is None:
+            keep_versions = getattr(settings, "ELASTIC_SEARCH_REINDEX_KEEP_VERSIONS", 2)
+        # the new version is always kept
+        keep_versions = max(1, keep_versions)
+
+        versions = self._index_versions()
+        new_index_name = "{}_v{}".format(self.index_name, versions[-1][0] + 1 if versions else 1)
+        log.info("rebuilding index %s within %s", self.index_name, new_index_name)
+
+        new_engine = self.__class__(index=new_index_name)
+        rebuild_cache_item_name = ElasticSearchEngine.get_rebuild_cache_item_name(self.index_name)
+        cache.set(rebuild_cache_item_name, new_index_name, getattr(settings, "ELASTIC_SEARCH_REINDEX_TIMEOUT", 86400))
+        try:
+            try:
+                # the partitions are created up front, so that they are loaded like the index itself
+                for index_name in new_engine.partitioner.index_names():
+                    new_engine._partition_engine(index_name)  # pylint: disable=protected-access
+                with new_engine.bulk_load():
+                    populate(new_engine)
+                for search_args in (warm_searches or []):
+                    new_engine.search(**search_args)
+            except Exception:
+                log.exception("error while rebuilding index %s, removing %s", self.index_name, new_index_name)
+                cache.delete(rebuild_cache_item_name)
+                self._delete_index_version(new_index_name)
+                raise
+
+            self._swap_alias(new_index_name)
+        finally:
+            cache.delete(rebuild_cache_item_name)
+
+        for _, old_index_name in self._index_versions()[:-keep_versions]:
+            if old_index_name != new_index_name:
+                log.info("removing old version %s of index %s", old_index_name, self.index_name)
+                self._delete_index_version(old_index_name)
+
+        return new_index_name
+
+    def _delete_index_version(self, index_name):
+        """ Delete a version of the index built by reindex, along with its partitions """
+        partition_pattern = IndexPartitioner(index_name).partition_index_name("*")
+        for name in [index_name] + sorted(self._es.indices.get_settings(index=partition_pattern)):
+            # pylint: disable=unexpected-keyword-arg
+            self._es.indices.delete(index=name, ignore=[404])
+
+    def _swap_alias(self, new_index_name):
+        """
+        Point the alias of our index name at new_index_name alone, and the alias of each of our partitions at the
+        corresponding partition of new_index_name, in a single atomic operation - partitions of ours without a
+        counterpart in the new index are removed
+        """
+        partition_prefix = IndexPartitioner(self.index_name).partition_index_name("")
+        served_pattern = "{},{}*".format(self.index_name, partition_prefix)
+
+        # the name of ours which each index of the new version takes
+        swaps = {self.index_name: new_index_name}
+        new_partition_pattern = IndexPartitioner(new_index_name).partition_index_name("*")
+        for new_partition_name in self._es.indices.get_settings(index=new_partition_pattern):
+            swaps[self.index_name + new_partition_name[len(new_index_name):]] = new_partition_name
+        actions = [
+            {"add": {"index": index_name, "alias": alias_name}} for alias_name, index_name in sorted(swaps.items())
+        ]
+
+        def is_ours(name):
+            """ whether the name is that of our index or one of its partitions """
+            return name == self.index_name or name.startswith(partition_prefix)
+
+        served_names = set(swaps)
+        if self._es.indices.exists_alias(name=served_pattern):
+            for current_index_name, index_aliases in self._es.indices.get_alias(name=served_pattern).items():
+                for alias_name in index_aliases.get("aliases", {}):
+                    if is_ours(alias_name):
+                        actions.append({"remove": {"index": current_index_name, "alias": alias_name}})
+                        served_names.add(alias_name)
+
+        # the first rebuild (or the first since a partition was added) replaces indices created in place, with
+        # which an alias cannot share its name
+        replaced_index_names = sorted(
+            index_name
+            for index_name in self._es.indices.get_settings(index=served_pattern, ignore_unavailable=True)
+            if is_ours(index_name)
+        )
+        served_names.update(replaced_index_names)
+
+        doc_types = set()
+        all_indices = ",".join([served_pattern] + sorted(swaps.values()))
+        for index_mappings in self._es.indices.get_mapping(index=all_indices, ignore_unavailable=True).values():
+            doc_types.update(index_mappings.get("mappings", {}))
+
+        if replaced_index_names:
+            log.warning("replacing indices %s with aliases to %s", replaced_index_names, new_index_name)
+            self._replace_indices_with_aliases(replaced_index_names, swaps, actions)
+        else:
+            self._es.indices.update_aliases(body={"actions": actions})
+
+        # whatever we remember about the previous indices no longer applies
+        for served_name in served_names:
+            for doc_type in doc_types:
+                ElasticSearchEngine.set_mappings(served_name, doc_type, {})
+            ElasticSearchEngine.bump_mappings_version(served_name)
+        # the new version was refreshed at the end of its load
+        self._record_change(refreshed=True)
+
+    def _replace_indices_with_aliases(self, replaced_index_names, swaps, actions):
+        """
+        Delete the indices named replaced_index_names, performing the alias actions in their place - atomically
+        where elasticsearch supports that (from 6.4), otherwise as soon afterward as possible
+        """
+        try:
+            self._es.indices.update_aliases(body={"actions": actions + [
+                {"remove_index": {"index": index_name}} for index_name in replaced_index_names
+            ]})
+            return
+        except exceptions.RequestError as ex:
+            log.warning(
+                "elasticsearch cannot replace indices %s with aliases atomically, so they will be missing for a "
+                "moment - %s",
+                replaced_index_names, ex
+            )
+
+        # make sure that the new indices can take an alias before the indices go
+        for index_name in swaps.values():
+            check_alias_name = "{}_alias_check".format(index_name)
+            self._es.indices.put_alias(index=index_name, name=check_alias_name)
+            self._es.indices.delete_alias(index=index_name, name=check_alias_name)
+
+        for index_name in replaced_index_names:
+            self._es.indices.delete(index=index_name)
+        try:
+            self._es.indices.update_aliases(body={"actions": actions})
+        except exceptions.ElasticsearchException:
+            # searches have neither the indices nor the aliases, so put the aliases back by the simplest means there is
+            log.exception("could not alias %s, trying again", sorted(swaps))
+            for alias_name, index_name in swaps.items():
+                self._es.indices.put_alias(index=index_name, name=alias_name)
+
+    def _check_mappings(self, doc_type, bodies):
         """
         We desire to index content so that anything we want to be textually searchable(and therefore needing to be
         analysed), but the other fields are designed to be filters, and only require an exact match. So, we want to
         set up the mappings for these fields as "not_analyzed" - this will allow our filters to work faster because
         they only have to work off exact matches
+
+        The new fields across all of the bodies are gathered together, so that a batch of documents needs at most
+        one mapping update
         """
 
         # Make fields other than content be indexed as unanalyzed terms - content
@@ -333,11 +1433,15 @@ class ElasticSearchEngine(SearchEngine):
 
             return prop_val
 
-        new_properties = {
-            field: field_property(field, value)
-            for field, value in body.items()
-            if (field not in exclude_fields) and (field not in self._get_mappings(doc_type).get('properties', {}))
-        }
+        mapped_fields = self._get_mappings(doc_type).get('properties', {})
+        new_properties = {}
+        for body in bodies:
+            for field, value in body.items():
+                if field in exclude_fields or field in mapped_fields:
+                    continue
+                # object fields may hold different sub-fields in different documents, so combine them
+                if field not in new_properties or isinstance(value, dict):
+                    _merge_properties(new_properties, {field: field_property(field, value)})
 
         if new_properties:
             self._es.indices.put_mapping(
@@ -351,55 +1455,202 @@ class ElasticSearchEngine(SearchEngine):
             )
             self._clear_mapping(doc_type)
 
-    def index(self, doc_type, sources, **kwargs):
+    def index(self, doc_type, sources, thread_count=None, queue_size=None, **kwargs):
         """
         Implements call to add documents to the ES index
-        Note the call to _check_mappings which will setup fields with the desired mappings
+        Note the call to _check_mappings which will setup fields with the desired mappings for the whole batch
+
+        When thread_count (default settings.ELASTIC_SEARCH_BULK_THREAD_COUNT, or 1) is greater than 1, chunks of
+        ELASTIC_SEARCH_BULK_CHUNK_SIZE documents are sent concurrently upon that many threads, with up to
+        queue_size (default settings.ELASTIC_SEARCH_BULK_QUEUE_SIZE, or 4) further chunks queued
+
+        While the index is being rebuilt (see reindex), the documents are indexed into the new index as well.
+        When the index is partitioned, any copies of the documents within other partitions are removed
         """
+        if thread_count is None:
+            thread_count = getattr(settings, "ELASTIC_SEARCH_BULK_THREAD_COUNT", 1)
+        if queue_size is None:
+            queue_size = getattr(settings, "ELASTIC_SEARCH_BULK_QUEUE_SIZE", 4)
 
+        sources = list(sources)
         try:
             actions = []
-            for source in sources:
-                self._check_mappings(doc_type, source)
-                id_ = source['id'] if 'id' in source else None
-                log.debug("indexing %s object with id %s", doc_type, id_)
-                action = {
-                    "_index": self.index_name,
-                    "_type": doc_type,
-                    "_id": id_,
-                    "_source": source
-                }
-                actions.append(action)
-            # bulk() returns a tuple with summary information
-            # number of successfully executed actions and number of errors if stats_only is set to True.
-            _, indexing_errors = bulk(
-                self._es,
-                actions,
-                **kwargs
-            )
+            # pylint: disable=protected-access
+            for engine, engine_sources in self._partition_sources(doc_type, sources):
+                engine._check_mappings(doc_type, engine_sources)
+                actions.extend(engine._index_action(doc_type, source) for source in engine_sources)
+            if thread_count > 1:
+                chunk_size = kwargs.pop("chunk_size", getattr(settings, "ELASTIC_SEARCH_BULK_CHUNK_SIZE", 500))
+                _, indexing_errors = _parallel_bulk(
+                    self._es,
+                    (actions[start:start + chunk_size] for start in range(0, len(actions), chunk_size)),
+                    thread_count,
+                    queue_size,
+                    **kwargs
+                )
+            else:
+                # bulk() returns a tuple with summary information
+                # number of successfully executed actions and number of errors if stats_only is set to True.
+                _, indexing_errors = _bulk_with_retry(
+                    self._es,
+                    actions,
+                    **kwargs
+                )
             if indexing_errors:
                 ElasticSearchEngine.log_indexing_error(indexing_errors)
+            self._remove_moved_documents(doc_type, actions, kwargs.get("refresh"))
         # Broad exception handler to protect around bulk call
         except Exception as ex:
             # log information and re-raise
             log.exception("error while indexing - %s", ex.message)
             raise
+        finally:
+            # even a failed bulk request may have changed some documents
+            self._record_change(refreshed=kwargs.get("refresh"))
+
+        self._apply_to_rebuild("index", doc_type, sources, thread_count=thread_count, queue_size=queue_size, **kwargs)
+
+    def _index_action(self, doc_type, source, serialized_source=None):
+        """ Bulk action to index the source document, optionally providing its already serialized form """
+        id_ = source['id'] if 'id' in source else None
+        log.debug("indexing %s object with id %s", doc_type, id_)
+        action = {
+            "_index": self.index_name,
+            "_type": doc_type,
+            "_id": id_,
+            # the client passes already serialized data through untouched
+            "_source": source if serialized_source is None else serialized_source
+        }
+        routing_field = self._routing_field()
+        if routing_field and source.get(routing_field) is not None:
+            action["_routing"] = source[routing_field]
+        return action
+
+    def _remove_moved_documents(self, doc_type, index_actions, refresh=None):
+        """
+        Remove the copies of the documents just indexed that are held within other indices of a partitioned
+        index - left behind when a change to a document moves it to another partition - refreshing as the
+        indexing did
+        """
+        if not self.partitioner.is_partitioned:
+            return
+        docs = []
+        for action in index_actions:
+            if action["_id"] is None:
+                continue
+            for index_name in self.partitioner.index_names():
+                if index_name != action["_index"]:
+                    doc = {"_index": index_name, "_type": doc_type, "_id": action["_id"]}
+                    if "_routing" in action:
+                        doc["_routing"] = action["_routing"]
+                    docs.append(doc)
+        if not docs:
+            return
+
+        actions = []
+        # fetched in real time, so that copies are found however recently they were indexed
+        for doc in self._es.mget(body={"docs": docs}, _source=False)["docs"]:
+            if doc.get("found"):
+                log.debug("removing %s object with id %s from %s, having moved", doc_type, doc["_id"], doc["_index"])
+                action = {"_op_type": "delete", "_index": doc["_index"], "_type": doc_type, "_id": doc["_id"]}
+                if "_routing" in doc:
+                    action["_routing"] = doc["_routing"]
+                actions.append(action)
+        if actions:
+            # ignore is flagged as an unexpected-keyword-arg; ES python client documents that it can be used
+            # pylint: disable=unexpected-keyword-arg
+            bulk_kwargs = {} if refresh is None else {"refresh": refresh}
+            _, removal_errors = bulk(self._es, actions, ignore=[404], raise_on_error=False, **bulk_kwargs)
+            if removal_errors:
+                ElasticSearchEngine.log_indexing_error(removal_errors)
+
+    def index_stream(self, doc_type, sources, chunk_size=None, max_chunk_bytes=None, **kwargs):
+        """
+        Implements streaming addition of documents to the ES index
+
+        sources are consumed lazily, and sent to elasticsearch in chunks of at most chunk_size documents
+        (settings.ELASTIC_SEARCH_BULK_CHUNK_SIZE, default 500) and max_chunk_bytes of serialized
+        documents (settings.ELASTIC_SEARCH_BULK_MAX_CHUNK_BYTES, default 10MB), so that only one chunk
+        is held in memory at any time - and indexed into the new index as well while the index is being
+        rebuilt (see reindex)
+
+        Yields:
+            tuple of the number of documents successfully indexed and the list of errors, for each chunk
+        """
+        if chunk_size is None:
+            chunk_size = getattr(settings, "ELASTIC_SEARCH_BULK_CHUNK_SIZE", 500)
+        if max_chunk_bytes is None:
+            max_chunk_bytes = getattr(settings, "ELASTIC_SEARCH_BULK_MAX_CHUNK_BYTES", 10 * 1024 * 1024)
+        # errors are reported per chunk rather than raised
+        kwargs.setdefault("raise_on_error", False)
+
+        chunks = _chunk_sources(sources, chunk_size, max_chunk_bytes, self._es.transport.serializer.dumps)
+        for chunk in chunks:
+            try:
+                actions = []
+                # pylint: disable=protected-access
+                for engine, engine_chunk in self._partition_sources(doc_type, chunk, lambda item: item[0]):
+                    engine._check_mappings(doc_type, [source for source, _ in engine_chunk])
+                    actions.extend(
+                        engine._index_action(doc_type, source, serialized_source)
+                        for source, serialized_source in engine_chunk
+                    )
+                success_count, indexing_errors = _bulk_with_retry(
+                    self._es,
+                    actions,
+                    chunk_size=len(actions),
+                    **kwargs
+                )
+                self._remove_moved_documents(doc_type, actions, kwargs.get("refresh"))
+            # Broad exception handler to protect around bulk call
+            except Exception as ex:
+                # log information and re-raise
+                log.exception("error while indexing - %s", ex.message)
+                raise
+            finally:
+                self._record_change(refreshed=kwargs.get("refresh"))
+
+            self._apply_to_rebuild("index", doc_type, [source for source, _ in chunk], **kwargs)
+            yield success_count, indexing_errors
 
     def remove(self, doc_type, doc_ids, **kwargs):
-        """ Implements call to remove the documents from the index """
+        """
+        Implements call to remove the documents from the index - and from the new index as well while the
+        index is being rebuilt (see reindex)
+
+        When documents are routed (see settings.ELASTIC_SEARCH_ROUTING_FIELD) or the index is partitioned, the
+        documents have to be found before they can be removed. Routed documents are found by a search, which
+        only sees them once the index has refreshed after they were indexed, so callers should provide the
+        routing of the documents as routing where they know it - which also saves the search, and for an
+        unpartitioned index, finding the documents at all
+        """
 
         try:
             # ignore is flagged as an unexpected-keyword-arg; ES python client documents that it can be used
             # pylint: disable=unexpected-keyword-arg
+            doc_ids = list(doc_ids)
+            # routed or partitioned documents can only be deleted from their own shard and index, so find them
+            locations = {}
+            if doc_ids and (self.partitioner.is_partitioned or (self._routing_field() and "routing" not in kwargs)):
+                locations = self._document_locations(doc_type, doc_ids, kwargs.get("routing"))
+                missing_ids = [doc_id for doc_id in doc_ids if doc_id not in locations]
+                if missing_ids:
+                    log.warning(
+                        "%s documents to remove were not found within %s, so are removed from it without routing - %s",
+                        doc_type, self.index_name, missing_ids
+                    )
             actions = []
             for doc_id in doc_ids:
                 log.debug("remove index for %s object with id %s", doc_type, doc_id)
+                location = locations.get(doc_id, {})
                 action = {
                     '_op_type': 'delete',
-                    "_index": self.index_name,
+                    "_index": location.get("_index", self.index_name),
                     "_type": doc_type,
                     "_id": doc_id
                 }
+                if "_routing" in location:
+                    action["_routing"] = location["_routing"]
                 actions.append(action)
             # bulk() returns a tuple with summary information
             # number of successfully executed actions and number of errors if stats_only is set to True.
@@ -417,6 +1668,10 @@ class ElasticSearchEngine(SearchEngine):
             # log information and re-raise
             log.exception("error while deleting document from index - %s", ex.message)
             raise ex
+        finally:
+            self._record_change(refreshed=kwargs.get("refresh"))
+
+        self._apply_to_rebuild("remove", doc_type, doc_ids, **kwargs)
 
     # A few disabled pylint violations here:
     # This procedure takes each of the possible input parameters and builds the query with each argument
@@ -442,10 +1697,31 @@ class ElasticSearchEngine(SearchEngine):
                facet_terms=None,
                exclude_ids=None,
                use_field_match=False,
+               search_after=None,
+               source_includes=None,
+               source_excludes=None,
+               facet_selection_dictionary=None,
                **kwargs):  # pylint: disable=too-many-arguments, too-many-locals, too-many-branches
         """
         Implements call to search the index for the desired content.
 
+        When settings.ELASTIC_SEARCH_RESULT_CACHE_TIMEOUT is set, results are cached (in the django
+        cache) for that many seconds; any index or remove operation upon the index invalidates them.
+        Since elasticsearch only sees changes once it refreshes the index, no results are cached for
+        settings.ELASTIC_SEARCH_RESULT_CACHE_SETTLE_TIME seconds (default 2, which should exceed the
+        refresh interval of the index) after a change made without refresh.
+
+        When settings.ELASTIC_SEARCH_COALESCE_SEARCHES is set, identical searches made concurrently by
+        threads of this process are sent to elasticsearch once, and the others wait for its results;
+        a search made after a change to the index never waits for one begun before the change.
+        If the result cache is enabled, setting ELASTIC_SEARCH_COALESCE_LOCK_DIR to a local directory
+        extends this to all processes upon the host: they take turns, and all but the first find the
+        results within the cache. None waits more than ELASTIC_SEARCH_COALESCE_LOCK_TIMEOUT seconds
+        (default 5) for its turn before searching anyway.
+
+        When settings.ELASTIC_SEARCH_ROUTING_FIELD is set, and field_dictionary pins that field to a
+        single value, the search is routed to the one shard that holds the documents with that value.
+
         Args:
             query_string (str): the string of values upon which to search within the
             content of the objects within the index
@@ -482,6 +1758,19 @@ class ElasticSearchEngine(SearchEngine):
             (deprecated) exclude_ids (list): list of id values to exclude from the results -
             useful for finding maches that aren't "one of these"
 
+            search_after (list): when provided, results are sorted upon score and then id, and each result
+            includes its "sort" values; pass the sort values of the last result of one page to get the next
+            page, or an empty list for the first page - unlike from_, this costs the same however deep the page
+
+            source_includes (list) / source_excludes (list): fields of each document to return within (or omit
+            from) the results' data, as dotted paths which may include wildcards, e.g. ["content.*"] - by default
+            the whole document is returned
+
+            facet_selection_dictionary (dict): dictionary of facet values chosen by the user, which
+            _must_ match in order for the documents to be included in the results (as for
+            field_dictionary) - but the counts for each facet are narrowed only by the selections
+            upon the other facets, so that alternatives to the chosen values can still be offered
+
         Returns:
             dict object with results in the desired format
             {
@@ -539,77 +1828,257 @@ class ElasticSearchEngine(SearchEngine):
 
         log.debug("searching index with %s", query_string)
 
-        elastic_queries = []
-        elastic_filters = []
+        search_arguments = {
+            "query_string": query_string,
+            "field_dictionary": field_dictionary,
+            "filter_dictionary": filter_dictionary,
+            "exclude_dictionary": exclude_dictionary,
+            "facet_terms": facet_terms,
+            "exclude_ids": exclude_ids,
+            "use_field_match": use_field_match,
+            "search_after": search_after,
+            "source_includes": source_includes,
+            "source_excludes": source_excludes,
+            "facet_selection_dictionary": facet_selection_dictionary,
+            "kwargs": kwargs,
+        }
 
-        # We have a query string, search all fields for matching text within the "content" node
-        if query_string:
-            elastic_queries.append({
-                "query_string": {
-                    "fields": ["content.*"],
-                    "query": query_string.encode('utf-8').translate(None, RESERVED_CHARACTERS)
-                }
-            })
+        cache_timeout = self._result_cache_timeout()
+        coalesce = self._coalesces_searches()
+        search_key = None
+        if cache_timeout or coalesce:
+            # includes the result generation, so searches after a change to the index never share earlier results
+            search_key = ElasticSearchEngine.get_result_cache_item_name(self.index_name, search_arguments)
+        cache_item_name = search_key if cache_timeout else None
+        store_item_name = cache_item_name
+        if cache_item_name:
+            recent_change_item_name = ElasticSearchEngine.get_recent_change_cache_item_name(self.index_name)
+            cached_items = cache.get_many([cache_item_name, recent_change_item_name])
+            if cached_items.get(cache_item_name) is not None:
+                return cached_items[cache_item_name]
+            # until the index has refreshed after a change, results may not reflect it, so are not worth keeping
+            if cached_items.get(recent_change_item_name):
+                store_item_name = None
+
+        body = _build_search_body(
+            query_string,
+            field_dictionary,
+            filter_dictionary,
+            exclude_dictionary,
+            facet_terms,
+            exclude_ids,
+            use_field_match,
+            search_after,
+            source_includes,
+            source_excludes,
+            facet_selection_dictionary
+        )
 
-        if field_dictionary:
-            if use_field_match:
-                elastic_queries.extend(_process_field_queries(field_dictionary))
-            else:
-                elastic_filters.extend(_process_field_filters(field_dictionary))
+        kwargs = dict(self._search_routing(field_dictionary), **kwargs)
+        search_index = self.partitioner.search_indices(field_dictionary)
+
+        def perform_search():
+            """ query elasticsearch, taking turns with other processes making the same request if so configured """
+            lock_dir = getattr(settings, "ELASTIC_SEARCH_COALESCE_LOCK_DIR", None)
+            if not (cache_item_name and lock_dir):
+                return self._perform_search(search_index, body, store_item_name, cache_timeout, **kwargs)
+
+            lock_timeout = getattr(settings, "ELASTIC_SEARCH_COALESCE_LOCK_TIMEOUT", 5)
+            with _interprocess_lock(lock_dir, cache_item_name, lock_timeout):
+                # whoever held the lock before us may well have just cached these results - and if the wait timed
+                # out, whoever holds it may have been slow rather than stuck, so look before searching regardless
+                cached_results = cache.get(cache_item_name)
+                if cached_results is not None:
+                    return cached_results
+                return self._perform_search(search_index, body, store_item_name, cache_timeout, **kwargs)
+
+        if not coalesce:
+            return perform_search()
+
+        results, shared = _get_search_flights().do(search_key, perform_search)
+        # callers are free to modify their results, so each caller of a shared search gets its own copy
+        return copy.deepcopy(results) if shared else results
+
+    def _perform_search(self, search_index, body, cache_item_name, cache_timeout, **kwargs):
+        """ Send the search request to elasticsearch, and cache the results if desired """
+        try:
+            es_response = self._es.search(
+                index=search_index,
+                body=body,
+                **kwargs
+            )
+        except exceptions.ElasticsearchException as ex:
+            # log information and re-raise
+            log.exception("error while searching index - %s", ex.message)
+            raise
 
-        if filter_dictionary:
-            elastic_filters.extend(_process_filters(filter_dictionary))
+        results = _translate_hits(es_response)
+        if cache_item_name:
+            cache.set(cache_item_name, results, cache_timeout)
+        return results
+
+    def scan(self,
+             query_string=None,
+             field_dictionary=None,
+             filter_dictionary=None,
+             exclude_dictionary=None,
+             exclude_ids=None,
+             use_field_match=False,
+             size=500,
+             scroll="5m",
+             **kwargs):  # pylint: disable=too-many-arguments
+        """
+        Implements iteration over every matching document, however many there are, by scrolling through
+        the index size documents at a time - each scroll stays open for the scroll duration between batches
 
-        # Support deprecated argument of exclude_ids
-        if exclude_ids:
-            if not exclude_dictionary:
-                exclude_dictionary = {}
-            if "_id" not in exclude_dictionary:
-                exclude_dictionary["_id"] = []
-            exclude_dictionary["_id"].extend(exclude_ids)
+        Arguments are the same as for search (facets aside); results are yielded one at a time, in no particular
+        order, in the same format as the results from search
+        """
+        log.debug("scanning index with %s", query_string)
+
+        body = _build_search_body(
+            query_string,
+            field_dictionary,
+            filter_dictionary,
+            exclude_dictionary,
+            exclude_ids=exclude_ids,
+            use_field_match=use_field_match
+        )
 
-        if exclude_dictionary:
-            elastic_filters.append(_process_exclude_dictionary(exclude_dictionary))
+        kwargs = dict(self._search_routing(field_dictionary), **kwargs)
+        try:
+            search_index = self.partitioner.search_indices(field_dictionary)
+            for hit in scan_hits(self._es, query=body, index=search_index, size=size, scroll=scroll, **kwargs):
+                yield _translate_result(hit)
+        except exceptions.ElasticsearchException as ex:
+            # log information and re-raise
+            log.exception("error while scanning index - %s", ex.message)
+            raise
 
-        query_segment = {
-            "match_all": {}
-        }
-        if elastic_queries:
-            query_segment = {
-                "bool": {
-                    "must": elastic_queries
-                }
-            }
+    def count(self,
+              query_string=None,
+              field_dictionary=None,
+              filter_dictionary=None,
+              exclude_dictionary=None,
+              exclude_ids=None,
+              use_field_match=False,
+              **kwargs):  # pylint: disable=too-many-arguments
+        """
+        Implements call to find how many documents match, using the count endpoint so that no hits are
+        retrieved - arguments are the same as for search (facets and paging aside)
+        """
+        log.debug("counting index with %s", query_string)
+
+        body = _build_search_body(
+            query_string,
+            field_dictionary,
+            filter_dictionary,
+            exclude_dictionary,
+            exclude_ids=exclude_ids,
+            use_field_match=use_field_match
+        )
 
-        query = query_segment
-        if elastic_filters:
-            filter_segment = {
-                "bool": {
-                    "must": elastic_filters
-                }
-            }
-            query = {
-                "filtered": {
-                    "query": query_segment,
-                    "filter": filter_segment,
-                }
-            }
+        kwargs = dict(self._search_routing(field_dictionary), **kwargs)
+        try:
+            es_response = self._es.count(
+                index=self.partitioner.search_indices(field_dictionary), body=body, **kwargs
+            )
+        except exceptions.ElasticsearchException as ex:
+            # log information and re-raise
+            log.exception("error while counting index - %s", ex.message)
+            raise
+
+        return es_response["count"]
+
+    def multi_search(self, searches):
+        """
+        Implements call to perform several searches within a single request to the index
+
+        Searches whose results are within the result cache (see search) are served from there, and only the
+        others are sent to elasticsearch; request parameters such as doc_type or timeout apply to their own
+        search alone, within its header (or its body, for those that elasticsearch only accepts there)
+
+        Args:
+            searches (list): list of dictionaries, each holding the arguments that would be
+            provided to search() for one of the searches
 
-        body = {"query": query}
-        if facet_terms:
-            facet_query = _process_facet_terms(facet_terms)
-            if facet_query:
-                body["facets"] = facet_query
+        Returns:
+            list of results, in the same order as searches, each in the format returned by search()
 
+        Raises:
+            ElasticsearchException when there is a problem with the response for any of the searches
+        """
+        if not searches:
+            return []
+
+        # as for search, the arguments from which the body is built are separated from the request parameters
+        search_arguments_list = []
+        for search_args in searches:
+            search_args = dict(search_args)
+            search_arguments = {
+                name: search_args.pop(name, default) for name, default in SEARCH_BODY_ARGUMENTS.items()
+            }
+            search_arguments["kwargs"] = search_args
+            search_arguments_list.append(search_arguments)
+
+        results = [None] * len(searches)
+        cache_timeout = self._result_cache_timeout()
+        cache_item_names = [None] * len(searches)
+        if cache_timeout:
+            cache_item_names = [
+                ElasticSearchEngine.get_result_cache_item_name(self.index_name, search_arguments)
+                for search_arguments in search_arguments_list
+            ]
+            recent_change_item_name = ElasticSearchEngine.get_recent_change_cache_item_name(self.index_name)
+            cached_results = cache.get_many(cache_item_names + [recent_change_item_name])
+            results = [cached_results.get(cache_item_name) for cache_item_name in cache_item_names]
+            # until the index has refreshed after a change, results may not reflect it, so are not worth keeping
+            if cached_results.get(recent_change_item_name):
+                cache_item_names = [None] * len(searches)
+
+        request_body = []
+        pending = []
+        request_timeout = None
+        for position, search_arguments in enumerate(search_arguments_list):
+            if results[position] is not None:
+                continue
+
+            parameters = dict(search_arguments["kwargs"])
+            header = {"index": self.partitioner.search_indices(search_arguments["field_dictionary"])}
+            header.update(self._search_routing(search_arguments["field_dictionary"]))
+            if "doc_type" in parameters:
+                header["type"] = parameters.pop("doc_type")
+            # the timeout for the whole request to elasticsearch, which has to cover the slowest of the searches
+            if parameters.get("request_timeout") is not None:
+                request_timeout = max(request_timeout, parameters.pop("request_timeout"))
+
+            body = _build_search_body(**{name: search_arguments[name] for name in SEARCH_BODY_ARGUMENTS})
+            for name, body_name in MSEARCH_BODY_PARAMETERS.items():
+                if parameters.get(name) is not None:
+                    body[body_name] = parameters.pop(name)
+            header.update(parameters)
+
+            request_body.extend([header, body])
+            pending.append(position)
+
+        if not pending:
+            return results
+
+        log.debug("searching index with %d searches", len(pending))
+
+        msearch_kwargs = {} if request_timeout is None else {"request_timeout": request_timeout}
         try:
-            es_response = self._es.search(
-                index=self.index_name,
-                body=body,
-                **kwargs
-            )
+            es_responses = self._es.msearch(body=request_body, **msearch_kwargs)["responses"]
+            for es_response in es_responses:
+                if "error" in es_response:
+                    raise exceptions.ElasticsearchException(es_response["error"])
         except exceptions.ElasticsearchException as ex:
             # log information and re-raise
             log.exception("error while searching index - %s", ex.message)
             raise
 
-        return _translate_hits(es_response)
+        for position, es_response in zip(pending, es_responses):
+            results[position] = _translate_hits(es_response)
+            if cache_item_names[position]:
+                cache.set(cache_item_names[position], results[position], cache_timeout)
+        return results
@@ -1,9 +1,7 @@
 """ overridable filter object to inject fields to auto-filter upon within searches """
-from datetime import datetime
-
 from django.conf import settings
 
-from .utils import _load_class, DateRange
+from .utils import _load_class, _utcnow_to_the_minute, DateRange
 
 
 class SearchFilterGenerator(object):
@@ -17,7 +15,7 @@ class SearchFilterGenerator(object):
     # pylint: disable=unused-argument, no-self-use
     def filter_dictionary(self, **kwargs):
         """ base implementation which filters via start_date """
-        return {"start_date": DateRange(None, datetime.utcnow())}
+        return {"start_date": DateRange(None, _utcnow_to_the_minute())}
 
     def field_dictionary(self, **kwargs):
         """ base implementation which add course if provided """
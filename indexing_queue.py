@@ -0,0 +1,118 @@
+""" Background queue to batch up index and remove operations for a search engine """
+import atexit
+from collections import OrderedDict
+import itertools
+import logging
+import threading
+import time
+
+# log appears to be standard name used for logger
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+INDEX_OPERATION = "index"
+REMOVE_OPERATION = "remove"
+
+
+class IndexingQueue(object):
+
+    """
+    Collects index and remove operations, and performs them upon the engine from a worker thread
+
+    Operations are keyed upon doc_type and id - a later operation for the same document replaces
+    any earlier one still waiting, so repeated updates within the delay result in a single write.
+    The worker flushes a batch as soon as batch_size documents are waiting, or once the oldest
+    waiting operation is delay seconds old.
+    """
+
+    def __init__(self, engine, batch_size, delay):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.delay = delay
+        self._pending = OrderedDict()
+        self._oldest = None
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+        # documents without an id cannot be coalesced, so each gets its own key
+        self._anonymous_keys = itertools.count()
+        atexit.register(self.flush)
+
+    def add_index(self, doc_type, sources):
+        """ queue the documents to be added to the index """
+        with self._condition:
+            for source in sources:
+                doc_id = source["id"] if "id" in source else ("anonymous", next(self._anonymous_keys))
+                self._add((doc_type, doc_id), (INDEX_OPERATION, source))
+
+    def add_remove(self, doc_type, doc_ids):
+        """ queue the documents to be removed from the index """
+        with self._condition:
+            for doc_id in doc_ids:
+                self._add((doc_type, doc_id), (REMOVE_OPERATION, doc_id))
+
+    def _add(self, key, operation):
+        """ replace any operation waiting for the same document, and let the worker know - call holding _condition """
+        self._pending.pop(key, None)
+        self._pending[key] = operation
+        if self._oldest is None:
+            self._oldest = time.time()
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="search-indexing-queue")
+            self._worker.daemon = True
+            self._worker.start()
+        self._condition.notify()
+
+    def _is_due(self):
+        """ is there a batch ready to be sent - call holding _condition """
+        return bool(self._pending) and (
+            len(self._pending) >= self.batch_size or time.time() - self._oldest >= self.delay
+        )
+
+    def _run(self):
+        """ worker loop, sending batches as they become due """
+        while True:
+            with self._condition:
+                while not self._is_due():
+                    timeout = None if self._oldest is None else max(0, self._oldest + self.delay - time.time())
+                    self._condition.wait(timeout)
+            self._flush_batch()
+
+    def _flush_batch(self):
+        """ send up to batch_size of the waiting operations, returns whether any were sent """
+        with self._flush_lock:
+            with self._condition:
+                keys = list(itertools.islice(self._pending, self.batch_size))
+                batch = [(key, self._pending.pop(key)) for key in keys]
+                # what is left over is already due
+                self._oldest = (time.time() - self.delay) if self._pending else None
+
+            if not batch:
+                return False
+
+            removals = OrderedDict()
+            additions = OrderedDict()
+            for (doc_type, _), (operation, value) in batch:
+                operations = removals if operation == REMOVE_OPERATION else additions
+                operations.setdefault(doc_type, []).append(value)
+
+            for doc_type, doc_ids in removals.items():
+                self._perform(self.engine.remove, doc_type, doc_ids)
+            for doc_type, sources in additions.items():
+                self._perform(self.engine.index, doc_type, sources)
+
+            return True
+
+    @staticmethod
+    def _perform(operation, doc_type, values):
+        """ perform the operation, logging rather than raising any problem since there is no caller to tell """
+        try:
+            operation(doc_type, values)
+        # Broad exception handler, the worker must keep going
+        except Exception as ex:  # pylint: disable=broad-except
+            log.exception("error while performing queued %s of %d %s documents - %r", operation.__name__,
+                          len(values), doc_type, ex)
+
+    def flush(self):
+        """ send everything waiting right away, returning once done """
+        while self._flush_batch():
+            pass
@@ -0,0 +1,106 @@
+""" overridable strategies to spread a search index across several physical indices """
+import re
+
+from django.conf import settings
+
+from .utils import _is_iterable, ValueRange
+
+# Separates the index name from the partition within physical index names - versioned indices built by
+# ElasticSearchEngine.reindex use a single underscore, so the two can never be confused
+PARTITION_SEPARATOR = "__"
+
+
+def _partition_key(value):
+    """ Form of the value that may be used within an index name """
+    return re.sub(r'[^a-z0-9_\-]+', '-', unicode(value).lower())
+
+
+class IndexPartitioner(object):
+
+    """
+    Class to decide in which physical index each document of a search index is stored, and which
+    physical indices each search must visit. This base implementation keeps everything within the
+    index itself.
+
+    Users of this search app may override this class and update setting for SEARCH_PARTITION_STRATEGY;
+    the class is constructed with the name of the search index it is to partition.
+    """
+
+    is_partitioned = False
+
+    def __init__(self, index_name):
+        self.index_name = index_name
+
+    def partition_index_name(self, partition):
+        """ Name of the physical index for the partition """
+        return "{}{}{}".format(self.index_name, PARTITION_SEPARATOR, partition)
+
+    # disabling pylint violations because overriders will want to use these
+    def document_index(self, doc_type, source):  # pylint: disable=unused-argument
+        """ Physical index within which to store the document """
+        return self.index_name
+
+    def search_indices(self, field_dictionary=None):  # pylint: disable=unused-argument
+        """
+        Physical index, or comma separated list of indices and index patterns, to search given the
+        field_dictionary of the search
+        """
+        return self.index_name
+
+    def index_names(self):
+        """ Physical indices known to hold documents, which may be created ahead of indexing into them """
+        return [self.index_name]
+
+
+class FieldValuePartitioner(IndexPartitioner):
+
+    """
+    Stores the documents with each of the values listed within settings.SEARCH_PARTITION_VALUES for the
+    field settings.SEARCH_PARTITION_FIELD (default "org") within a physical index of their own, named
+    "<index name>__<value>", and all other documents within the index itself. Large tenants can be isolated
+    this way, and sized upon their own shards (e.g. with an index template matching "<index name>__*").
+
+    Searches which pin the field to particular values visit only the indices for those values, along with the
+    index itself, which holds the documents with several values for the field; other searches, such as course
+    discovery, visit the index and every partition by way of an index pattern. A document moved to another
+    partition by a change to its value is removed from the index it leaves when it is indexed again - but
+    changing SEARCH_PARTITION_FIELD or SEARCH_PARTITION_VALUES for an existing index requires it to be rebuilt
+    with ElasticSearchEngine.reindex(), since no document moves until then.
+    """
+
+    is_partitioned = True
+
+    def __init__(self, index_name):
+        super(FieldValuePartitioner, self).__init__(index_name)
+        self.field = getattr(settings, "SEARCH_PARTITION_FIELD", "org")
+        self.partitions = {
+            value: self.partition_index_name(_partition_key(value))
+            for value in getattr(settings, "SEARCH_PARTITION_VALUES", [])
+        }
+
+    def _value_index(self, value):
+        """ Physical index holding the documents with the value for the field """
+        return self.partitions.get(value, self.index_name)
+
+    def document_index(self, doc_type, source):
+        """ Partition for the document's value of the field - documents with several values stay in the index """
+        value = source.get(self.field)
+        if value is None or _is_iterable(value):
+            return self.index_name
+        return self._value_index(value)
+
+    def index_names(self):
+        """ The index, and the partition for each of the values """
+        return [self.index_name] + sorted(set(self.partitions.values()))
+
+    def search_indices(self, field_dictionary=None):
+        """
+        The index, with the indices for the values to which the search pins the field - else with all partitions
+        """
+        value = field_dictionary.get(self.field) if field_dictionary else None
+        if value is None or isinstance(value, ValueRange):
+            return ",".join([self.index_name, self.partition_index_name("*")])
+
+        values = value if _is_iterable(value) else [value]
+        # documents with several values for the field stay within the index, whichever of them the search wants
+        return ",".join(sorted(set([self.index_name] + [self._value_index(value) for value in values])))
@@ -1,8 +1,43 @@
 """ Abstract SearchEngine with factory method """
 # This will get called by tests, but pylint thinks that it is not used
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
 from django.conf import settings
 
-from .utils import _load_class
+from .indexing_queue import IndexingQueue
+from .partitioning import IndexPartitioner
+from .utils import _load_class, ProcessRegistry
+
+# Engines are reused for the life of the process - one per implementation class and index name
+_ENGINES = ProcessRegistry()
+
+# Worker threads upon which the async_* operations run; like the engines, never shared across a fork
+_POOLS = ProcessRegistry()
+
+
+def _get_async_pool():
+    """ Return the shared pool of threads used for asynchronous operations """
+    return _POOLS.get_or_create(
+        "async",
+        lambda: ThreadPool(getattr(settings, "SEARCH_ASYNC_POOL_SIZE", 10))
+    )
+
+
+# Queued index and remove operations - one queue per implementation class and index name
+_QUEUES = ProcessRegistry()
+
+
+def _get_indexing_queue(engine):
+    """ Return the shared queue of operations for the engine's class and index """
+    return _QUEUES.get_or_create(
+        (engine.__class__, engine.index_name),
+        lambda: IndexingQueue(
+            engine,
+            getattr(settings, "SEARCH_INDEXING_QUEUE_BATCH_SIZE", 500),
+            getattr(settings, "SEARCH_INDEXING_QUEUE_DELAY", 2),
+        )
+    )
 
 
 class SearchEngine(object):
@@ -11,14 +46,41 @@ class SearchEngine(object):
 
     index_name = "courseware"
 
+    # whether search takes facet_selection_dictionary - implementors which do should set this, so that callers
+    # know to provide the user's facet choices that way rather than within field_dictionary
+    supports_facet_selection = False
+
     def __init__(self, index=None):
         if index:
             self.index_name = index
+        # where the documents of the index are stored - see settings.SEARCH_PARTITION_STRATEGY
+        self.partitioner = _load_class(
+            getattr(settings, "SEARCH_PARTITION_STRATEGY", None),
+            IndexPartitioner
+        )(self.index_name)
 
     def index(self, doc_type, sources, **kwargs):
         """ This operation is called to add documents of given type to the search index """
         raise NotImplementedError
 
+    def index_stream(self, doc_type, sources, chunk_size=500, **kwargs):
+        """
+        Add documents from a (possibly very large) iterable of sources, consuming it lazily and
+        indexing chunk_size documents at a time. Yields a tuple of the number of documents indexed
+        and the list of errors for each chunk. This base implementation indexes each chunk with index
+        """
+        chunk = []
+        for source in sources:
+            chunk.append(source)
+            if len(chunk) >= chunk_size:
+                self.index(doc_type, chunk, **kwargs)
+                yield len(chunk), []
+                chunk = []
+
+        if chunk:
+            self.index(doc_type, chunk, **kwargs)
+            yield len(chunk), []
+
     def remove(self, doc_type, doc_ids, **kwargs):
         """ This operation is called to remove documents of given type from the search index """
         raise NotImplementedError
@@ -29,10 +91,104 @@ class SearchEngine(object):
                filter_dictionary=None,
                exclude_dictionary=None,
                facet_terms=None,
+               facet_selection_dictionary=None,
                **kwargs):  # pylint: disable=too-many-arguments
-        """ This operation is called to search for matching documents within the search index """
+        """
+        This operation is called to search for matching documents within the search index
+
+        facet_selection_dictionary holds the facet values chosen by the user: like field_dictionary, they must
+        match for documents to be included, but each facet's counts are narrowed only by the choices upon the
+        other facets. Implementors supporting it set supports_facet_selection; callers pass the choices within
+        field_dictionary instead to those which do not
+        """
         raise NotImplementedError
 
+    @contextmanager
+    def bulk_load(self):
+        """
+        Context within which to load large numbers of documents, e.g. for a full reindex - implementors
+        may tune the index for loading upon entry, and restore it upon exit
+        """
+        yield self
+
+    def queue_index(self, doc_type, sources):
+        """
+        Add documents to the index in the background, returning immediately
+
+        Operations are batched by a worker thread, which sends them once SEARCH_INDEXING_QUEUE_BATCH_SIZE
+        documents are waiting or SEARCH_INDEXING_QUEUE_DELAY seconds have passed; a later operation upon
+        the same document id within that time replaces the earlier one. Problems are logged, not raised.
+        """
+        _get_indexing_queue(self).add_index(doc_type, sources)
+
+    def queue_remove(self, doc_type, doc_ids):
+        """ Remove documents from the index in the background, returning immediately - see queue_index """
+        _get_indexing_queue(self).add_remove(doc_type, doc_ids)
+
+    def flush_queue(self):
+        """ Perform all queued operations right away, returning once they are done """
+        _get_indexing_queue(self).flush()
+
+    def scan(self,
+             query_string=None,
+             field_dictionary=None,
+             filter_dictionary=None,
+             exclude_dictionary=None,
+             **kwargs):  # pylint: disable=too-many-arguments
+        """
+        This operation is called to iterate over every matching document within the search index, however
+        many there are - yields each result in the same format as the results from search
+        """
+        raise NotImplementedError
+
+    def count(self,
+              query_string=None,
+              field_dictionary=None,
+              filter_dictionary=None,
+              exclude_dictionary=None,
+              **kwargs):  # pylint: disable=too-many-arguments
+        """
+        Find how many documents match, without retrieving any of them - arguments are as for search. This
+        base implementation takes the total from a search for no results; implementors may do better
+        """
+        return self.search(
+            query_string=query_string,
+            field_dictionary=field_dictionary,
+            filter_dictionary=filter_dictionary,
+            exclude_dictionary=exclude_dictionary,
+            size=0,
+            **kwargs
+        )["total"]
+
+    def multi_search(self, searches):
+        """
+        Perform several searches at once - each item within searches is a dictionary of the arguments
+        for search, and the results are returned as a list in the same order. This base implementation
+        performs the searches one after another; implementors may be able to batch them
+        """
+        return [self.search(**search_args) for search_args in searches]
+
+    def async_index(self, doc_type, sources, **kwargs):
+        """
+        Non-blocking version of index; returns an AsyncResult whose get() method
+        yields the outcome (or raises the exception) of the operation
+        """
+        return _get_async_pool().apply_async(self.index, (doc_type, sources), kwargs)
+
+    def async_remove(self, doc_type, doc_ids, **kwargs):
+        """ Non-blocking version of remove; returns an AsyncResult for the operation """
+        return _get_async_pool().apply_async(self.remove, (doc_type, doc_ids), kwargs)
+
+    def async_search(self, query_string=None, **kwargs):
+        """
+        Non-blocking version of search; returns an AsyncResult whose get() method yields the
+        search results, so that many searches can be in flight at once, e.g.:
+
+            pending = [searcher.async_search(term) for term in terms]
+            results = [search.get() for search in pending]
+        """
+        return _get_async_pool().apply_async(self.search, (query_string,), kwargs)
+
     def search_string(self, query_string, **kwargs):
         """ Helper function when primary search is for a query string """
         return self.search(query_string=query_string, **kwargs)
@@ -45,6 +201,33 @@ class SearchEngine(object):
     def get_search_engine(index=None):
         """
         Returns the desired implementor (defined in settings)
+
+        The engine is shared process-wide for each implementation and index name, so that
+        connection setup and index checks happen once rather than upon every request
         """
         search_engine_class = _load_class(getattr(settings, "SEARCH_ENGINE", None), None)
-        return search_engine_class(index=index) if search_engine_class else None
+        if not search_engine_class:
+            return None
+
+        return _ENGINES.get_or_create(
+            (search_engine_class, index),
+            lambda: search_engine_class(index=index)
+        )
+
+    @staticmethod
+    def clear_search_engines():
+        """ Discard the shared engines, new ones will be created upon next request """
+        _ENGINES.clear()
+
+    @staticmethod
+    def warm_search_engines(index_names=None):
+        """
+        Create the shared engines (and their connections) ahead of the first request
+
+        Intended to be called from the application server's post-fork hook (e.g. gunicorn's
+        `post_fork` or uWSGI's `@postfork`), so that each worker builds its own connections
+        rather than paying for them upon its first search
+        """
+        if index_names is None:
+            index_names = [getattr(settings, "COURSEWARE_INDEX_NAME", "courseware_index")]
+        return [SearchEngine.get_search_engine(index_name) for index_name in index_names]
@@ -0,0 +1,79 @@
+""" JSON serialization of search requests and results, pluggable using settings.SEARCH_JSON_SERIALIZER """
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from elasticsearch.exceptions import SerializationError
+
+from .utils import ProcessRegistry, _load_class
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+
+class JSONSerializer(object):
+    """
+    Serializer using the standard library json module, encoding dates, times, decimals and the like
+    just as DjangoJSONEncoder does.
+
+    Serializers provide the interface that the Elasticsearch client expects of its serializer -
+    mimetype, dumps and loads - so that a single implementation can be used both for the traffic with
+    elasticsearch and for the responses from the search views. Override and update the setting
+    SEARCH_JSON_SERIALIZER to use another implementation.
+    """
+
+    mimetype = "application/json"
+    json_module = json
+    dumps_arguments = {}
+
+    def __init__(self):
+        self._default = DjangoJSONEncoder().default
+
+    def dumps(self, data):
+        """ serialize the data - strings are taken to be serialized already, and are returned unchanged """
+        if isinstance(data, basestring):
+            return data
+        try:
+            return self.json_module.dumps(data, default=self._default, **self.dumps_arguments)
+        except (ValueError, TypeError) as ex:
+            raise SerializationError(data, ex)
+
+    def loads(self, serialized):
+        """ deserialize the json string """
+        try:
+            return self.json_module.loads(serialized)
+        except (ValueError, TypeError) as ex:
+            raise SerializationError(serialized, ex)
+
+
+class SimpleJSONSerializer(JSONSerializer):
+    """
+    Serializer using simplejson, whose C extension is considerably faster than the standard library
+    json module of python 2.7 - requires the simplejson package to be installed.
+
+    Note that simplejson deserializes strings holding only ascii characters as str rather than unicode
+    """
+
+    json_module = simplejson
+    # leave decimals to DjangoJSONEncoder's handling, which encodes them as strings
+    dumps_arguments = {"use_decimal": False}
+
+    def __init__(self):
+        if simplejson is None:
+            raise ImproperlyConfigured("SimpleJSONSerializer requires the simplejson package")
+        super(SimpleJSONSerializer, self).__init__()
+
+
+_SERIALIZERS = ProcessRegistry()
+
+
+def get_json_serializer():
+    """ Return the configured serializer, shared within the process """
+    serializer_class = getattr(settings, "SEARCH_JSON_SERIALIZER", None)
+    return _SERIALIZERS.get_or_create(
+        serializer_class,
+        lambda: _load_class(serializer_class, JSONSerializer)()
+    )
@@ -1,6 +1,8 @@
 """ Implementation of search interface to be used for tests where ElasticSearch is unavailable """
+from collections import OrderedDict
 import copy
 from datetime import datetime
+from fnmatch import fnmatch
 import json
 import os
 import pytz
@@ -193,16 +195,54 @@ def _count_facet_values(documents, facet_terms):
         facets[facet] = {
             "total": total,
             "terms": terms,
+            "other": 0,
         }
 
     return facets
 
 
+def _count_selected_facet_values(documents, facet_terms, facet_selections):
+    """
+    Calculate the counts for the facets provided, where each facet is narrowed by the
+    selections made upon the other facets, but not by those made upon itself
+    """
+    if not facet_selections:
+        return _count_facet_values(documents, facet_terms)
+
+    facets = {}
+    for facet in facet_terms:
+        other_selections = {field: value for field, value in facet_selections.items() if field != facet}
+        faceted_documents = _filter_intersection(documents, other_selections)
+        facets.update(_count_facet_values(faceted_documents, {facet: facet_terms[facet]}))
+    return facets
+
+
+def _project_source(source, includes=None, excludes=None, path=None):
+    """
+    Emulate elasticsearch source filtering - includes and excludes are lists of dotted field paths,
+    which may contain wildcards; an object that is included is included with all of its children
+    """
+    projected = {}
+    for key, value in source.items():
+        field_path = key if path is None else "{}.{}".format(path, key)
+        if excludes and any(fnmatch(field_path, pattern) for pattern in excludes):
+            continue
+        included = not includes or any(fnmatch(field_path, pattern) for pattern in includes)
+        if isinstance(value, dict):
+            value = _project_source(value, None if included else includes, excludes, field_path)
+            if included or value:
+                projected[key] = value
+        elif included:
+            projected[key] = value
+    return projected
+
+
 class MockSearchEngine(SearchEngine):
 
     """
     Mock implementation of SearchEngine for test purposes
     """
+    supports_facet_selection = True
     _mock_elastic = {}
     _disabled = False
     _file_name_override = None
@@ -336,22 +376,13 @@ class MockSearchEngine(SearchEngine):
             return None
         MockSearchEngine.remove_documents(self.index_name, doc_type, doc_ids)
 
-    def search(self,
-               query_string=None,
-               field_dictionary=None,
-               filter_dictionary=None,
-               exclude_dictionary=None,
-               facet_terms=None,
-               **kwargs):  # pylint: disable=too-many-arguments
-        """ Perform search upon documents within index """
-        if MockSearchEngine._disabled:
-            return {
-                "took": 10,
-                "total": 0,
-                "max_score": 0,
-                "results": []
-            }
-
+    def _find_documents(self,
+                        query_string=None,
+                        field_dictionary=None,
+                        filter_dictionary=None,
+                        exclude_dictionary=None,
+                        **kwargs):  # pylint: disable=too-many-arguments
+        """ Find the documents within the index that match - a document may be included multiple times """
         documents_to_search = []
         if "doc_type" in kwargs:
             documents_to_search = MockSearchEngine.load_doc_type(self.index_name, kwargs["doc_type"])
@@ -380,6 +411,32 @@ class MockSearchEngine(SearchEngine):
         if exclude_dictionary:
             documents_to_search = _process_exclude_dictionary(documents_to_search, exclude_dictionary)
 
+        return documents_to_search
+
+    def search(self,
+               query_string=None,
+               field_dictionary=None,
+               filter_dictionary=None,
+               exclude_dictionary=None,
+               facet_terms=None,
+               **kwargs):  # pylint: disable=too-many-arguments
+        """ Perform search upon documents within index """
+        if MockSearchEngine._disabled:
+            return {
+                "took": 10,
+                "total": 0,
+                "max_score": 0,
+                "results": []
+            }
+
+        documents_to_search = self._find_documents(
+            query_string,
+            field_dictionary,
+            filter_dictionary,
+            exclude_dictionary,
+            **kwargs
+        )
+
         # Finally, find duplicates and give them a higher score
         def score_documents(documents_to_search):
             """ Apply scoring to documents that have multiple matches """
@@ -401,13 +458,42 @@ class MockSearchEngine(SearchEngine):
                 )
             return search_results, max_score
 
-        search_results, max_score = score_documents(documents_to_search)
+        # facet selections narrow the results, but not the facet counts - see _count_selected_facet_values
+        facet_selections = kwargs.get("facet_selection_dictionary")
+        selected_documents = documents_to_search
+        if facet_selections:
+            selected_documents = _filter_intersection(documents_to_search, facet_selections)
 
-        results = MockSearchEngine._paginate_results(
-            kwargs["size"] if "size" in kwargs else None,
-            kwargs["from_"] if "from_" in kwargs else None,
-            sorted(search_results, key=lambda k: k["score"])
-        )
+        search_results, max_score = score_documents(selected_documents)
+
+        search_after = kwargs.get("search_after")
+        if search_after is None:
+            results = MockSearchEngine._paginate_results(
+                kwargs["size"] if "size" in kwargs else None,
+                kwargs["from_"] if "from_" in kwargs else None,
+                sorted(search_results, key=lambda k: k["score"])
+            )
+        else:
+            # emulate sorting upon score descending with id as tie-breaker, and resuming after the given values
+            def sort_key(result):
+                """ the position of the result within the sort order """
+                return (-result["score"], result["data"].get("id"))
+
+            sorted_results = sorted(search_results, key=sort_key)
+            for result in sorted_results:
+                result["sort"] = [result["score"], result["data"].get("id")]
+            if search_after:
+                sorted_results = [r for r in sorted_results if sort_key(r) > (-search_after[0], search_after[1])]
+            results = MockSearchEngine._paginate_results(
+                kwargs["size"] if "size" in kwargs else None,
+                None,
+                sorted_results
+            )
+
+        if kwargs.get("source_includes") or kwargs.get("source_excludes"):
+            for result in results:
+                result["data"] = _project_source(result["data"], kwargs.get("source_includes"),
+                                                 kwargs.get("source_excludes"))
 
         response = {
             "took": 10,
@@ -417,6 +503,40 @@ class MockSearchEngine(SearchEngine):
         }
 
         if facet_terms:
-            response["facets"] = _count_facet_values(documents_to_search, facet_terms)
+            response["facets"] = _count_selected_facet_values(documents_to_search, facet_terms, facet_selections)
 
         return response
+
+    def count(self,
+              query_string=None,
+              field_dictionary=None,
+              filter_dictionary=None,
+              exclude_dictionary=None,
+              **kwargs):  # pylint: disable=too-many-arguments
+        """ Count the matching documents within index """
+        return sum(
+            1 for _ in self.scan(query_string, field_dictionary, filter_dictionary, exclude_dictionary, **kwargs)
+        )
+
+    def scan(self,
+             query_string=None,
+             field_dictionary=None,
+             filter_dictionary=None,
+             exclude_dictionary=None,
+             **kwargs):  # pylint: disable=too-many-arguments
+        """ Iterate over all matching documents within index """
+        if MockSearchEngine._disabled:
+            return
+
+        # a document that matches several times is the same object each time
+        matches = OrderedDict()
+        for document in self._find_documents(query_string, field_dictionary, filter_dictionary, exclude_dictionary,
+                                             **kwargs):
+            _, score = matches.get(id(document), (document, 0))
+            matches[id(document)] = (document, score + 1)
+
+        for document, score in matches.values():
+            yield {
+                "score": score,
+                "data": copy.copy(document),
+            }
@@ -11,9 +11,11 @@ from datetime import datetime
 from django.test import TestCase
 from django.test.utils import override_settings
 from elasticsearch import Elasticsearch
+from mock import patch
 
 from search.api import course_discovery_search, NoSearchEngineError
 from search.elastic import ElasticSearchEngine
+from search.filter_generator import SearchFilterGenerator
 from search.tests.utils import SearcherMixin, TEST_INDEX_NAME
 from .mock_search_engine import MockSearchEngine
 
@@ -243,6 +245,63 @@ class TestMockCourseDiscoverySearch(TestCase, SearcherMixin):  # pylint: disable
         self.assertEqual(results["facets"]["modes"]["terms"]["verified"], 2)
         self.assertEqual(results["facets"]["modes"]["terms"]["other"], 1)
 
+    def test_multi_select_faceting(self):
+        """ Test that each facet's counts are narrowed by the selections upon other facets, but not its own """
+        DemoCourse.get_and_index(self.searcher, {"org": "OrgA", "modes": ["honor", "verified"]})
+        DemoCourse.get_and_index(self.searcher, {"org": "OrgA", "modes": ["honor"]})
+        DemoCourse.get_and_index(self.searcher, {"org": "OrgB", "modes": ["honor"]})
+        DemoCourse.get_and_index(self.searcher, {"org": "OrgB", "modes": ["verified"]})
+        DemoCourse.get_and_index(self.searcher, {"modes": ["other"]})
+
+        results = course_discovery_search(field_dictionary={"org": "OrgA"})
+        self.assertEqual(results["total"], 2)
+        self.assertTrue(all(result["data"]["org"] == "OrgA" for result in results["results"]))
+
+        self.assertEqual(results["facets"]["org"]["total"], 4)
+        self.assertEqual(results["facets"]["org"]["terms"], {"OrgA": 2, "OrgB": 2})
+
+        self.assertEqual(results["facets"]["modes"]["total"], 3)
+        self.assertEqual(results["facets"]["modes"]["terms"], {"honor": 2, "verified": 1})
+
+        results = course_discovery_search(field_dictionary={"org": "OrgB", "modes": "verified"})
+        self.assertEqual(results["total"], 1)
+        self.assertEqual(results["facets"]["org"]["terms"], {"OrgA": 1, "OrgB": 1})
+        self.assertEqual(results["facets"]["modes"]["terms"], {"honor": 1, "verified": 1})
+
+    def test_facet_selection_unsupported(self):
+        """ engines which do not support facet selections should still have the choices narrow the results """
+        DemoCourse.get_and_index(self.searcher, {"org": "OrgA", "modes": ["honor", "verified"]})
+        DemoCourse.get_and_index(self.searcher, {"org": "OrgA", "modes": ["honor"]})
+        DemoCourse.get_and_index(self.searcher, {"org": "OrgB", "modes": ["honor"]})
+
+        with patch.object(type(self.searcher), "supports_facet_selection", False):
+            results = course_discovery_search(field_dictionary={"org": "OrgA"})
+        self.assertEqual(results["total"], 2)
+        self.assertTrue(all(result["data"]["org"] == "OrgA" for result in results["results"]))
+        # as before facet selections, the counts are narrowed by the choices as well
+        self.assertEqual(results["facets"]["org"]["terms"], {"OrgA": 2})
+
+    def test_facet_selection_restricted(self):
+        """ the filter generator's restrictions should apply to the facet counts as well as the results """
+        DemoCourse.get_and_index(self.searcher, {"org": "OrgA", "modes": ["honor"]})
+        DemoCourse.get_and_index(self.searcher, {"org": "OrgB", "modes": ["honor", "verified"]})
+        DemoCourse.get_and_index(self.searcher, {"org": "OrgC", "modes": ["honor"]})
+
+        with patch.object(
+            SearchFilterGenerator,
+            "generate_field_filters",
+            return_value=({"org": ["OrgA", "OrgB"]}, {}, {})
+        ):
+            results = course_discovery_search(field_dictionary={"modes": "honor"})
+            self.assertEqual(results["total"], 2)
+            self.assertEqual(results["facets"]["org"]["terms"], {"OrgA": 1, "OrgB": 1})
+            self.assertEqual(results["facets"]["modes"]["terms"], {"honor": 2, "verified": 1})
+
+            # choosing a hidden org does not reveal it
+            results = course_discovery_search(field_dictionary={"org": "OrgC"})
+            self.assertEqual(results["total"], 0)
+            self.assertEqual(results["facets"]["org"]["terms"], {"OrgA": 1, "OrgB": 1})
+
     @override_settings(COURSE_DISCOVERY_FILTERS=["test_name", "modes"])
     def test_faceting_filters(self):
         """ Test that facet under consideration can be specified by virtue of filters being overriden """
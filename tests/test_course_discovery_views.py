@@ -114,6 +114,27 @@ class DiscoveryUrlTest(MockSearchUrlTest):
         result_ids = [r["data"]["id"] for r in results["results"]]
         self.assertIn(DemoCourse.DEMO_COURSE_ID + "_3", result_ids)
 
+    def test_cursor_pagination(self):
+        """ test that paging by cursor returns each result once """
+        code, results = post_discovery_request({"search_string": "Find this one", "page_size": 2, "cursor": ""})
+        self.assertTrue(code < 300 and code > 199)
+        self.assertEqual(results["total"], 3)
+        self.assertEqual(len(results["results"]), 2)
+        result_ids = [r["data"]["id"] for r in results["results"]]
+
+        code, results = post_discovery_request(
+            {"search_string": "Find this one", "page_size": 2, "cursor": results["cursor"]}
+        )
+        self.assertTrue(code < 300 and code > 199)
+        self.assertEqual(results["total"], 3)
+        self.assertEqual(len(results["results"]), 1)
+        self.assertIsNone(results["cursor"])
+        result_ids.extend([r["data"]["id"] for r in results["results"]])
+        self.assertEqual(
+            sorted(result_ids),
+            [DemoCourse.DEMO_COURSE_ID + "_1", DemoCourse.DEMO_COURSE_ID + "_2", DemoCourse.DEMO_COURSE_ID + "_3"]
+        )
+
     def test_field_matching(self):
         """ test that requests can specify field matches """
         code, results = post_discovery_request({"org": "OrgA"})
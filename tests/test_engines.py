@@ -7,14 +7,28 @@
 from datetime import datetime
 import json
 import os
+import shutil
+import tempfile
+import time
 
 from mock import patch
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.utils import override_settings
-from elasticsearch import exceptions
+from elasticsearch import Elasticsearch, exceptions
+from elasticsearch.client import IndicesClient
+from elasticsearch.helpers import bulk
 
-from search.elastic import RESERVED_CHARACTERS
-from search.tests.utils import ErroringElasticImpl, SearcherMixin
+from search.elastic import (
+    RESERVED_CHARACTERS, BulkRetryPolicy, ElasticSearchEngine,
+    _build_search_body, _bulk_with_retry, _get_elasticsearch_client, _interprocess_lock, _merge_properties,
+    _translate_hits
+)
+from search.search_engine_base import SearchEngine
+from search.utils import DateRange, SingleFlight
+from search.tests.utils import (
+    ErroringElasticImpl, ForceRefreshElasticSearchEngine, SearcherMixin, TEST_INDEX_NAME
+)
 from search.api import perform_search, NoSearchEngineError
 
 from .mock_search_engine import MockSearchEngine, json_date_to_datetime
@@ -78,6 +92,804 @@ class ElasticSearchTests(MockSearchTests):
         self.assertNotIn("edX", org_term_counts)
         self.assertEqual(facet_results["org"]["other"], 1)
 
+    def test_batch_mappings(self):
+        """ a batch of documents with new fields should be mapped with a single mapping update """
+        with patch.object(
+            IndicesClient, "put_mapping", autospec=True, side_effect=IndicesClient.put_mapping
+        ) as put_mapping:
+            self.searcher.index("test_doc", [
+                {"id": "FAKE_ID_1", "org": "edX", "tags": {"color": "red"}},
+                {"id": "FAKE_ID_2", "course": "A/B/C", "tags": {"shape": "square"}},
+                {"id": "FAKE_ID_3", "org": "MITx", "start_date": datetime(2015, 1, 1)},
+            ])
+            self.assertEqual(put_mapping.call_count, 1)
+
+            # already mapped, so no further updates
+            self.searcher.index("test_doc", [{"id": "FAKE_ID_4", "org": "HarvardX"}])
+            self.assertEqual(put_mapping.call_count, 1)
+
+        properties = self.searcher._get_mappings("test_doc")["properties"]  # pylint: disable=protected-access
+        self.assertEqual(properties["org"]["index"], "not_analyzed")
+        self.assertEqual(properties["course"]["index"], "not_analyzed")
+        self.assertEqual(properties["start_date"]["type"], "date")
+        self.assertIn("color", properties["tags"]["properties"])
+        self.assertIn("shape", properties["tags"]["properties"])
+
+        response = self.searcher.search(field_dictionary={"tags.shape": "square"})
+        self.assertEqual(response["total"], 1)
+
+    def test_index_stream_bytes(self):
+        """ chunks should also be bounded by the size of the documents """
+        sources = [{"id": "FAKE_ID_{}".format(doc_index), "name": "x" * 100} for doc_index in range(3)]
+        chunks = list(self.searcher.index_stream("test_doc", iter(sources), max_chunk_bytes=150))
+        self.assertEqual(chunks, [(1, []), (1, []), (1, [])])
+
+        response = self.searcher.search(doc_type="test_doc")
+        self.assertEqual(response["total"], 3)
+
+    @override_settings(ELASTIC_SEARCH_BULK_LOAD_GREEN_TIMEOUT=1)
+    def test_bulk_load(self):
+        """ refreshes and replicas should be suspended within bulk load, and restored afterward """
+        def index_settings():
+            """ the flat settings of the test index """
+            return self.searcher._es.indices.get_settings(  # pylint: disable=protected-access
+                index=TEST_INDEX_NAME, flat_settings=True
+            )[TEST_INDEX_NAME]["settings"]
+
+        original_replicas = index_settings()["index.number_of_replicas"]
+
+        with self.assertRaises(ValueError):
+            with self.searcher.bulk_load():
+                loading_settings = index_settings()
+                self.assertEqual(loading_settings["index.refresh_interval"], "-1")
+                self.assertEqual(loading_settings["index.number_of_replicas"], "0")
+                self.searcher.index("test_doc", [{"id": "FAKE_ID", "content": {"name": "bulk loaded"}}])
+                raise ValueError("Make sure that settings get restored anyway")
+
+        restored_settings = index_settings()
+        self.assertNotEqual(restored_settings["index.refresh_interval"], "-1")
+        self.assertEqual(restored_settings["index.number_of_replicas"], original_replicas)
+
+        # refreshed upon exit, so can be found without a further refresh
+        response = self.searcher.search_string("loaded")
+        self.assertEqual(response["total"], 1)
+
+    @override_settings(ELASTIC_SEARCH_BULK_LOAD_GREEN_TIMEOUT=1)
+    def test_nested_bulk_load(self):
+        """ the original settings should be restored once the outermost of nested loads is done """
+        def index_settings():
+            """ the flat settings of the test index """
+            return self.searcher._es.indices.get_settings(  # pylint: disable=protected-access
+                index=TEST_INDEX_NAME, flat_settings=True
+            )[TEST_INDEX_NAME]["settings"]
+
+        original_replicas = index_settings()["index.number_of_replicas"]
+
+        with self.searcher.bulk_load():
+            with self.searcher.bulk_load():
+                self.assertEqual(index_settings()["index.refresh_interval"], "-1")
+            # still loading
+            self.assertEqual(index_settings()["index.refresh_interval"], "-1")
+
+        restored_settings = index_settings()
+        self.assertNotEqual(restored_settings["index.refresh_interval"], "-1")
+        self.assertEqual(restored_settings["index.number_of_replicas"], original_replicas)
+
+    @override_settings(ELASTIC_SEARCH_BULK_LOAD_GREEN_TIMEOUT=1)
+    def test_bulk_load_restore_failure(self):
+        """ a failure to restore the settings should be logged, not hide the exception from within the load """
+        with patch.object(
+            IndicesClient, "put_settings", autospec=True,
+            side_effect=[{}, exceptions.TransportError(500, "There is a problem here")]
+        ) as put_settings:
+            with self.assertRaises(ValueError):
+                with self.searcher.bulk_load():
+                    raise ValueError("This is the exception to raise")
+            self.assertEqual(put_settings.call_count, 2)
+
+    @override_settings(ELASTIC_SEARCH_BULK_LOAD_GREEN_TIMEOUT=1)
+    def test_reindex(self):
+        """ rebuilding should swap in a new version of the index behind an alias """
+        self.searcher.index("test_doc", [{"id": "OLD_ID", "content": {"name": "old document"}}])
+
+        def populate(engine):
+            """ the rebuilt index has different content """
+            engine.index("test_doc", [{"id": "NEW_ID", "content": {"name": "new document"}, "org": "edX"}])
+
+        try:
+            new_index_name = self.searcher.reindex(populate, warm_searches=[{"query_string": "document"}])
+            self.assertEqual(new_index_name, "{}_v1".format(TEST_INDEX_NAME))
+
+            response = self.searcher.search_string("document")
+            self.assertEqual(response["total"], 1)
+            self.assertEqual(response["results"][0]["data"]["id"], "NEW_ID")
+
+            # further indexing goes to the new version behind the alias, with its mappings
+            self.searcher.index("test_doc", [{"id": "NEXT_ID", "content": {"name": "next document"}, "org": "MITx"}])
+            response = self.searcher.search(field_dictionary={"org": "MITx"})
+            self.assertEqual(response["total"], 1)
+
+            self.assertEqual(self.searcher.reindex(populate), "{}_v2".format(TEST_INDEX_NAME))
+            self.assertEqual(self.searcher.reindex(populate), "{}_v3".format(TEST_INDEX_NAME))
+            # pylint: disable=protected-access
+            self.assertEqual([version for version, _ in self.searcher._index_versions()], [2, 3])
+
+            response = self.searcher.search_string("document")
+            self.assertEqual(response["total"], 1)
+        finally:
+            # ignore unexpected-keyword-arg; ES python client documents that it can be used
+            # pylint: disable=unexpected-keyword-arg
+            Elasticsearch().indices.delete(index="{}_v*".format(TEST_INDEX_NAME), ignore=[404])
+
+    @override_settings(ELASTIC_SEARCH_BULK_LOAD_GREEN_TIMEOUT=1)
+    def test_reindex_concurrent_writes(self):
+        """ changes made to the index while it is being rebuilt should not be lost at the swap """
+        self.searcher.index("test_doc", [{"id": "REMOVED_ID", "content": {"name": "removed document"}}])
+
+        def populate(engine):
+            """ the documents as they were when the rebuild began, then changed meanwhile """
+            engine.index("test_doc", [
+                {"id": "OLD_ID", "content": {"name": "old document"}},
+                {"id": "REMOVED_ID", "content": {"name": "removed document"}},
+            ])
+            self.searcher.index("test_doc", [{"id": "LIVE_ID", "content": {"name": "live document"}}])
+            self.searcher.remove("test_doc", ["REMOVED_ID"])
+
+        try:
+            self.searcher.reindex(populate, keep_versions=0)
+            response = self.searcher.search_string("document")
+            self.assertEqual(
+                sorted(result["data"]["id"] for result in response["results"]),
+                ["LIVE_ID", "OLD_ID"]
+            )
+
+            # the new version is kept however few versions are asked for
+            self.searcher.reindex(populate, keep_versions=0)
+            # pylint: disable=protected-access
+            self.assertEqual([version for version, _ in self.searcher._index_versions()], [2])
+
+            # writes are no longer doubled once the rebuild is done
+            self.assertIsNone(self.searcher._rebuild_engine())
+        finally:
+            # ignore unexpected-keyword-arg; ES python client documents that it can be used
+            # pylint: disable=unexpected-keyword-arg
+            Elasticsearch().indices.delete(index="{}_v*".format(TEST_INDEX_NAME), ignore=[404])
+
+    @override_settings(ELASTIC_SEARCH_BULK_LOAD_GREEN_TIMEOUT=1)
+    def test_reindex_without_atomic_replace(self):
+        """ the first rebuild should still swap in the alias where the index cannot be replaced atomically """
+        self.searcher.index("test_doc", [{"id": "OLD_ID", "content": {"name": "old document"}}])
+        update_aliases = IndicesClient.update_aliases
+
+        def refuse_remove_index(client, body, **kwargs):
+            """ as clusters before 6.4 do """
+            if any("remove_index" in action for action in body["actions"]):
+                raise exceptions.RequestError(400, "action_request_validation_exception")
+            return update_aliases(client, body=body, **kwargs)
+
+        def populate(engine):
+            """ the rebuilt index has different content """
+            engine.index("test_doc", [{"id": "NEW_ID", "content": {"name": "new document"}}])
+
+        try:
+            with patch.object(IndicesClient, "update_aliases", autospec=True, side_effect=refuse_remove_index):
+                self.searcher.reindex(populate)
+            response = self.searcher.search_string("document")
+            self.assertEqual([result["data"]["id"] for result in response["results"]], ["NEW_ID"])
+        finally:
+            # ignore unexpected-keyword-arg; ES python client documents that it can be used
+            # pylint: disable=unexpected-keyword-arg
+            Elasticsearch().indices.delete(index="{}_v*".format(TEST_INDEX_NAME), ignore=[404])
+
+    @override_settings(ELASTIC_SEARCH_BULK_LOAD_GREEN_TIMEOUT=1)
+    def test_reindex_failure(self):
+        """ a failed rebuild should leave the index as it was """
+        self.searcher.index("test_doc", [{"id": "OLD_ID", "content": {"name": "old document"}}])
+
+        def populate(engine):
+            """ fail part way through """
+            engine.index("test_doc", [{"id": "NEW_ID", "content": {"name": "new document"}}])
+            raise ValueError("There is a problem here")
+
+        with self.assertRaises(ValueError):
+            self.searcher.reindex(populate)
+
+        self.assertEqual(self.searcher._index_versions(), [])  # pylint: disable=protected-access
+        response = self.searcher.search_string("document")
+        self.assertEqual(response["results"][0]["data"]["id"], "OLD_ID")
+
+    @override_settings(ELASTIC_SEARCH_BULK_CHUNK_SIZE=2)
+    def test_parallel_index(self):
+        """ chunks of documents should be sent concurrently when configured with several threads """
+        sources = [{"id": "FAKE_ID_{}".format(doc_index), "content": {"name": "parallel"}} for doc_index in range(5)]
+        with patch('search.elastic.bulk', side_effect=bulk) as mock_bulk:
+            self.searcher.index("test_doc", sources, thread_count=2, queue_size=1)
+            self.assertEqual(mock_bulk.call_count, 3)
+
+        response = self.searcher.search_string("parallel")
+        self.assertEqual(response["total"], 5)
+
+    @override_settings(ELASTIC_SEARCH_RESULT_CACHE_TIMEOUT=60)
+    def test_result_cache(self):
+        """ repeated searches should be served from the cache until the index changes """
+        self.searcher.index("test_doc", [{"id": "FAKE_ID_1", "content": {"name": "cached result"}}])
+
+        with patch.object(Elasticsearch, "search", autospec=True, side_effect=Elasticsearch.search) as es_search:
+            response = self.searcher.search_string("cached")
+            self.assertEqual(response["total"], 1)
+            response = self.searcher.search_string("cached")
+            self.assertEqual(response["total"], 1)
+            self.assertEqual(es_search.call_count, 1)
+
+            # a different search is not served from the cache
+            response = self.searcher.search_string("cached", doc_type="test_doc")
+            self.assertEqual(response["total"], 1)
+            self.assertEqual(es_search.call_count, 2)
+
+            self.searcher.index("test_doc", [{"id": "FAKE_ID_2", "content": {"name": "another cached result"}}])
+            response = self.searcher.search_string("cached")
+            self.assertEqual(response["total"], 2)
+            self.assertEqual(es_search.call_count, 3)
+
+            self.searcher.remove("test_doc", ["FAKE_ID_1"])
+            response = self.searcher.search_string("cached")
+            self.assertEqual(response["total"], 1)
+            self.assertEqual(es_search.call_count, 4)
+
+    @override_settings(ELASTIC_SEARCH_RESULT_CACHE_TIMEOUT=60)
+    def test_result_cache_settle(self):
+        """ results should not be cached until changes made without refresh have become searchable """
+        ElasticSearchEngine.index(self.searcher, "test_doc", [
+            {"id": "FAKE_ID_1", "content": {"name": "settling result"}},
+        ])
+        # pylint: disable=protected-access
+        self.searcher._es.indices.refresh(index=TEST_INDEX_NAME)
+
+        with patch.object(Elasticsearch, "search", autospec=True, side_effect=Elasticsearch.search) as es_search:
+            self.searcher.search_string("settling")
+            self.assertEqual(self.searcher.search_string("settling")["total"], 1)
+            self.assertEqual(es_search.call_count, 2)
+            self.assertEqual(self.searcher.multi_search([{"query_string": "settling"}])[0]["total"], 1)
+            self.assertEqual(self.searcher.multi_search([{"query_string": "settling"}])[0]["total"], 1)
+
+            # once the index has had the time to refresh
+            cache.delete(ElasticSearchEngine.get_recent_change_cache_item_name(TEST_INDEX_NAME))
+            self.searcher.search_string("settling")
+            self.assertEqual(self.searcher.search_string("settling")["total"], 1)
+            self.assertEqual(es_search.call_count, 3)
+
+    @override_settings(ELASTIC_SEARCH_RESULT_CACHE_TIMEOUT=60)
+    def test_multi_search_parameters(self):
+        """ request parameters should apply to their own search, and cached results should not be requested again """
+        self.searcher.index("test_doc", [{"id": "FAKE_ID_1", "content": {"name": "cached result"}}])
+        searches = [
+            {"query_string": "cached", "doc_type": "test_doc", "timeout": "5s", "size": 1},
+            {"query_string": "cached", "request_timeout": 30},
+        ]
+
+        with patch.object(Elasticsearch, "msearch", autospec=True, side_effect=Elasticsearch.msearch) as es_msearch:
+            responses = self.searcher.multi_search(searches)
+            self.assertEqual([response["total"] for response in responses], [1, 1])
+            request_body = es_msearch.call_args[1]["body"]
+            self.assertEqual(request_body[0]["type"], "test_doc")
+            self.assertEqual(request_body[1]["timeout"], "5s")
+            self.assertEqual(request_body[1]["size"], 1)
+            self.assertEqual(es_msearch.call_args[1]["request_timeout"], 30)
+
+            # served from the cache, whether searched together or alone
+            with patch.object(Elasticsearch, "search") as es_search:
+                self.assertEqual(self.searcher.multi_search(searches), responses)
+                self.assertEqual(self.searcher.search(query_string="cached", request_timeout=30), responses[1])
+                self.assertFalse(es_search.called)
+            self.assertEqual(es_msearch.call_count, 1)
+
+    @override_settings(ELASTIC_SEARCH_COALESCE_SEARCHES=True)
+    def test_coalesce_generation(self):
+        """ a search made after a change to the index should not share one begun before the change """
+        with patch.object(SingleFlight, "do", autospec=True, side_effect=SingleFlight.do) as flight_do:
+            self.assertEqual(self.searcher.search_string("coalesced")["total"], 0)
+            self.searcher.index("test_doc", [{"id": "FAKE_ID", "content": {"name": "coalesced"}}])
+            self.assertEqual(self.searcher.search_string("coalesced")["total"], 1)
+
+        keys = [call[0][1] for call in flight_do.call_args_list]
+        self.assertEqual(len(keys), 2)
+        self.assertNotEqual(keys[0], keys[1])
+
+    @override_settings(ELASTIC_SEARCH_ROUTING_FIELD="course")
+    def test_routing(self):
+        """ documents should be routed by course, and searches within a course sent to its shard alone """
+        self.searcher.index("test_doc", [
+            {"id": "FAKE_ID_1", "course": "A/B/C", "content": {"name": "routed document"}},
+            {"id": "FAKE_ID_2", "course": "X/Y/Z", "content": {"name": "routed document"}},
+            {"id": "FAKE_ID_3", "content": {"name": "routed document"}},
+        ])
+
+        with patch.object(Elasticsearch, "search", autospec=True, side_effect=Elasticsearch.search) as es_search:
+            response = self.searcher.search(query_string="routed", field_dictionary={"course": "A/B/C"})
+            self.assertEqual([result["data"]["id"] for result in response["results"]], ["FAKE_ID_1"])
+            self.assertEqual(es_search.call_args[1]["routing"], "A/B/C")
+            self.assertEqual(response["results"][0]["_routing"], "A/B/C")
+
+            response = self.searcher.search(query_string="routed", field_dictionary={"course": ["A/B/C", "X/Y/Z"]})
+            self.assertEqual(response["total"], 2)
+            self.assertNotIn("routing", es_search.call_args[1])
+
+        self.assertEqual(self.searcher.count(field_dictionary={"course": "X/Y/Z"}), 1)
+        self.assertEqual(self.searcher.search(query_string="routed")["total"], 3)
+
+        # routed documents are removed from the shard upon which they were placed
+        self.searcher.remove("test_doc", ["FAKE_ID_1", "FAKE_ID_3"])
+        response = self.searcher.search(query_string="routed")
+        self.assertEqual([result["data"]["id"] for result in response["results"]], ["FAKE_ID_2"])
+
+        # callers providing the routing save finding the documents, and can remove those indexed since the last
+        # refresh, without forcing one
+        ElasticSearchEngine.index(self.searcher, "test_doc", [
+            {"id": "FAKE_ID_4", "course": "A/B/C", "content": {"name": "routed document"}},
+        ])
+        with patch.object(Elasticsearch, "search") as es_search:
+            with patch.object(IndicesClient, "refresh") as es_refresh:
+                self.searcher.remove("test_doc", ["FAKE_ID_4"], routing="A/B/C")
+                self.searcher.remove("test_doc", ["FAKE_ID_2"], routing="X/Y/Z")
+                self.assertFalse(es_search.called)
+                self.assertFalse(es_refresh.called)
+        self.assertEqual(self.searcher.search(query_string="routed")["total"], 0)
+
+    @override_settings(
+        SEARCH_PARTITION_STRATEGY="search.partitioning.FieldValuePartitioner",
+        SEARCH_PARTITION_VALUES=["MITx"]
+    )
+    def test_partitioning(self):
+        """ documents of a partitioned org should be stored in an index of their own, and found from either """
+        partition_index_name = "{}__mitx".format(TEST_INDEX_NAME)
+        searcher = ForceRefreshElasticSearchEngine(TEST_INDEX_NAME)
+        try:
+            searcher.index("test_doc", [
+                {"id": "FAKE_ID_1", "org": "MITx", "content": {"name": "partitioned document"}},
+                {"id": "FAKE_ID_2", "org": "edX", "content": {"name": "partitioned document"}},
+            ])
+            # pylint: disable=protected-access
+            self.assertTrue(searcher._es.exists(index=partition_index_name, doc_type="test_doc", id="FAKE_ID_1"))
+            self.assertTrue(searcher._es.exists(index=TEST_INDEX_NAME, doc_type="test_doc", id="FAKE_ID_2"))
+
+            with patch.object(Elasticsearch, "search", autospec=True, side_effect=Elasticsearch.search) as es_search:
+                response = searcher.search(query_string="partitioned", field_dictionary={"org": "MITx"})
+                self.assertEqual([result["data"]["id"] for result in response["results"]], ["FAKE_ID_1"])
+                self.assertEqual(
+                    es_search.call_args[1]["index"],
+                    "{},{}".format(TEST_INDEX_NAME, partition_index_name)
+                )
+
+            self.assertEqual(searcher.search(query_string="partitioned")["total"], 2)
+            self.assertEqual(searcher.count(field_dictionary={"org": "edX"}), 1)
+
+            # documents with several orgs stay within the index, but are found by searches for any of them
+            searcher.index("test_doc", [
+                {"id": "SHARED_ID", "org": ["MITx", "edX"], "content": {"name": "shared document"}},
+            ])
+            self.assertEqual(searcher.search(query_string="shared", field_dictionary={"org": "MITx"})["total"], 1)
+
+            # a document moving to another partition leaves nothing behind
+            searcher.index("test_doc", [{"id": "SHARED_ID", "org": "MITx", "content": {"name": "shared document"}}])
+            self.assertFalse(searcher._es.exists(index=TEST_INDEX_NAME, doc_type="test_doc", id="SHARED_ID"))
+            self.assertEqual(searcher.search(query_string="shared")["total"], 1)
+            searcher.remove("test_doc", ["SHARED_ID"])
+
+            # documents are removed from whichever index holds them
+            searcher.remove("test_doc", ["FAKE_ID_1"])
+            response = searcher.search(query_string="partitioned")
+            self.assertEqual([result["data"]["id"] for result in response["results"]], ["FAKE_ID_2"])
+
+            # including those indexed since the last refresh, without forcing one
+            ElasticSearchEngine.index(searcher, "test_doc", [
+                {"id": "FAKE_ID_3", "org": "MITx", "content": {"name": "partitioned document"}},
+            ])
+            with patch.object(IndicesClient, "refresh") as es_refresh:
+                ElasticSearchEngine.remove(searcher, "test_doc", ["FAKE_ID_3"])
+                self.assertFalse(es_refresh.called)
+            searcher._es.indices.refresh(index=searcher.partitioner.search_indices())
+            response = searcher.search(query_string="partitioned")
+            self.assertEqual([result["data"]["id"] for result in response["results"]], ["FAKE_ID_2"])
+
+            def populate(engine):
+                """ the rebuilt index has its own partitions """
+                engine.index("test_doc", [
+                    {"id": "NEW_ID_1", "org": "MITx", "content": {"name": "partitioned document"}},
+                    {"id": "NEW_ID_2", "org": "edX", "content": {"name": "partitioned document"}},
+                ])
+
+            # the index and its partitions are swapped for aliases to the new version together
+            with override_settings(ELASTIC_SEARCH_BULK_LOAD_GREEN_TIMEOUT=1):
+                new_index_name = searcher.reindex(populate)
+            # pylint: disable=protected-access
+            self.assertTrue(searcher._es.indices.exists_alias(index=new_index_name, name=TEST_INDEX_NAME))
+            self.assertTrue(searcher._es.indices.exists_alias(
+                index="{}__mitx".format(new_index_name), name=partition_index_name
+            ))
+            response = searcher.search(query_string="partitioned", field_dictionary={"org": "MITx"})
+            self.assertEqual([result["data"]["id"] for result in response["results"]], ["NEW_ID_1"])
+            self.assertEqual(searcher.search(query_string="partitioned")["total"], 2)
+
+            # further indexing goes to the partitions of the new version
+            searcher.index("test_doc", [{"id": "NEXT_ID", "org": "MITx", "content": {"name": "partitioned document"}}])
+            self.assertTrue(searcher._es.exists(
+                index="{}__mitx".format(new_index_name), doc_type="test_doc", id="NEXT_ID"
+            ))
+
+            # and a further rebuild removes the old version along with its partitions
+            with override_settings(ELASTIC_SEARCH_BULK_LOAD_GREEN_TIMEOUT=1):
+                searcher.reindex(populate, keep_versions=1)
+            self.assertFalse(searcher._es.indices.exists(index="{}__mitx".format(new_index_name)))
+            self.assertEqual(searcher.search(query_string="partitioned")["total"], 2)
+        finally:
+            # ignore unexpected-keyword-arg; ES python client documents that it can be used
+            # pylint: disable=protected-access,unexpected-keyword-arg
+            searcher._es.indices.delete(index=partition_index_name, ignore=[404])
+            searcher._es.indices.delete(index="{}_v*".format(TEST_INDEX_NAME), ignore=[404])
+
+
+class TestMergeProperties(TestCase):
+    """ Tests combining of mapping properties across documents """
+
+    def test_merge(self):
+        """ object fields should combine their sub-properties, other fields keep the first definition """
+        date_property = {"type": "date"}
+        properties = {}
+        _merge_properties(properties, {"start": date_property, "tags": {"properties": {"color": {"type": "string"}}}})
+        _merge_properties(properties, {
+            "start": {"type": "string"},
+            "tags": {"properties": {"shape": {"type": "string"}}},
+        })
+        self.assertEqual(properties, {
+            "start": {"type": "date"},
+            "tags": {"properties": {"color": {"type": "string"}, "shape": {"type": "string"}}},
+        })
+
+        # the merged structure must not share the properties provided
+        properties["start"]["format"] = "date_optional_time"
+        self.assertEqual(date_property, {"type": "date"})
+
+
+@override_settings(ELASTIC_SEARCH_MAPPINGS_LOCAL_TIMEOUT=60)
+class TestLocalMappings(TestCase):
+    """ Tests the in-process tier of the mappings cache """
+
+    def setUp(self):
+        super(TestLocalMappings, self).setUp()
+        cache.clear()
+
+    def test_local_mappings(self):
+        """ mappings should be served from within the process until cleared """
+        mappings = {"properties": {"org": {"type": "string", "index": "not_analyzed"}}}
+        ElasticSearchEngine.set_mappings("test_index", "test_doc", mappings)
+        self.assertEqual(ElasticSearchEngine.get_mappings("test_index", "test_doc"), mappings)
+
+        # no longer in the shared cache, but still held locally
+        cache.clear()
+        self.assertEqual(ElasticSearchEngine.get_mappings("test_index", "test_doc"), mappings)
+        self.assertEqual(ElasticSearchEngine.get_mappings("test_index", "other_doc"), {})
+
+        ElasticSearchEngine.set_mappings("test_index", "test_doc", {})
+        self.assertEqual(ElasticSearchEngine.get_mappings("test_index", "test_doc"), {})
+
+    def test_shared_mappings(self):
+        """ mappings set by another process should be picked up from the shared cache """
+        mappings = {"properties": {"org": {"type": "string", "index": "not_analyzed"}}}
+        cache.set(ElasticSearchEngine.get_cache_item_name("test_index", "shared_doc"), mappings)
+        self.assertEqual(ElasticSearchEngine.get_mappings("test_index", "shared_doc"), mappings)
+
+    @override_settings(ELASTIC_SEARCH_MAPPINGS_VERSION_INTERVAL=0)
+    def test_cleared_elsewhere(self):
+        """ mappings cleared by another process should no longer be served locally """
+        mappings = {"properties": {"org": {"type": "string", "index": "not_analyzed"}}}
+        cache.set(ElasticSearchEngine.get_cache_item_name("test_index", "test_doc"), mappings)
+        self.assertEqual(ElasticSearchEngine.get_mappings("test_index", "test_doc"), mappings)
+
+        # as another process does upon clearing the mappings, e.g. when the index is replaced
+        cache.set(ElasticSearchEngine.get_cache_item_name("test_index", "test_doc"), {})
+        cache.incr(ElasticSearchEngine.get_mappings_version_cache_item_name("test_index"))
+        self.assertEqual(ElasticSearchEngine.get_mappings("test_index", "test_doc"), {})
+
+
+def _streaming_bulk_rejecting(rejected_ids):
+    """ fake streaming_bulk which rejects (429) the actions with the given ids, failing any with id "bad" """
+    sent_ids = []
+
+    def streaming_bulk(_client, actions, **_kwargs):
+        """ yield the outcome of each action """
+        for action in actions:
+            sent_ids.append(action["_id"])
+            if action["_id"] == "bad":
+                yield False, {"index": {"_id": action["_id"], "status": 400, "error": "MapperParsingException"}}
+            elif action["_id"] in rejected_ids:
+                rejected_ids.remove(action["_id"])
+                yield False, {"index": {"_id": action["_id"], "status": 429, "error": "EsRejectedExecutionException"}}
+            else:
+                yield True, {"index": {"_id": action["_id"], "status": 201}}
+
+    return streaming_bulk, sent_ids
+
+
+@override_settings(
+    ELASTIC_SEARCH_BULK_MAX_RETRIES=2,
+    ELASTIC_SEARCH_BULK_INITIAL_BACKOFF=0,
+    ELASTIC_SEARCH_BULK_MAX_BACKOFF=0,
+)
+class TestBulkRetry(TestCase):
+    """ Tests retrying of bulk actions rejected by a busy cluster """
+
+    @staticmethod
+    def _actions(*ids):
+        """ index actions for the ids """
+        return [{"_index": "test_index", "_type": "test_doc", "_id": id_, "_source": {}} for id_ in ids]
+
+    def test_retry_rejected(self):
+        """ only the rejected actions should be resent """
+        counters = ElasticSearchEngine.bulk_retry_counters()
+        fake_bulk, sent_ids = _streaming_bulk_rejecting(["2", "3"])
+        with patch('search.elastic.streaming_bulk', side_effect=fake_bulk):
+            success_count, errors = _bulk_with_retry(None, self._actions("1", "2", "3", "bad"))
+
+        self.assertEqual(success_count, 3)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]["index"]["_id"], "bad")
+        self.assertEqual(sent_ids, ["1", "2", "3", "bad", "2", "3"])
+        self.assertEqual(ElasticSearchEngine.bulk_retry_counters()["retries"], counters["retries"] + 2)
+
+    def test_give_up(self):
+        """ actions still rejected once out of retries should be reported as errors """
+        counters = ElasticSearchEngine.bulk_retry_counters()
+        fake_bulk, sent_ids = _streaming_bulk_rejecting(["1", "1", "1", "1"])
+        with patch('search.elastic.streaming_bulk', side_effect=fake_bulk):
+            success_count, errors = _bulk_with_retry(None, self._actions("1", "2"))
+
+        self.assertEqual(success_count, 1)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]["index"]["status"], 429)
+        self.assertEqual(sent_ids, ["1", "2", "1", "1"])
+        self.assertEqual(ElasticSearchEngine.bulk_retry_counters()["give_ups"], counters["give_ups"] + 1)
+
+    @override_settings(ELASTIC_SEARCH_BULK_MAX_RETRIES=0)
+    def test_retries_disabled(self):
+        """ without retries configured, the plain bulk helper should be used """
+        self.assertIsNone(ElasticSearchEngine.bulk_retry_counters())
+        with patch('search.elastic.bulk', return_value=(2, [])) as mock_bulk:
+            self.assertEqual(_bulk_with_retry(None, self._actions("1", "2")), (2, []))
+            self.assertEqual(mock_bulk.call_count, 1)
+
+    def test_policy(self):
+        """ the budget and rejection rate should follow the outcomes of requests """
+        policy = BulkRetryPolicy(max_retries=3, initial_backoff=0, max_backoff=0, budget=2)
+        self.assertEqual(policy.take_retries(5, 0), 2)
+        self.assertEqual(policy.take_retries(1, 0), 0)
+        self.assertEqual(policy.counters()["give_ups"], 4)
+
+        with patch('search.elastic.time.time', return_value=1000):
+            policy.record(10, 5)
+            self.assertAlmostEqual(policy.rejection_rate, 0.1)
+        self.assertEqual(policy.take_retries(5, 1), 2)
+        self.assertEqual(policy.take_retries(5, 3), 0)
+
+    def test_rejection_rate_decay(self):
+        """ the rejection rate should fall away with time, even when no further requests are made """
+        policy = BulkRetryPolicy(max_retries=3, initial_backoff=0, max_backoff=60, budget=2)
+        with patch('search.elastic.time.time', return_value=1000):
+            policy.record(10, 10)
+            self.assertAlmostEqual(policy.rejection_rate, 0.2)
+        with patch('search.elastic.time.time', return_value=1000 + BulkRetryPolicy.REJECTION_RATE_HALF_LIFE):
+            self.assertAlmostEqual(policy.rejection_rate, 0.1)
+        with patch('search.elastic.time.time', return_value=1000 + 10 * BulkRetryPolicy.REJECTION_RATE_HALF_LIFE):
+            self.assertLess(policy.rejection_rate, 0.001)
+
+    def test_rejected_request(self):
+        """ the actions of a whole bulk request rejected as too busy should be resent """
+        sent_ids = []
+
+        def fake_bulk(_client, actions, **_kwargs):
+            """ turn away the first request after its first action, accept everything after that """
+            for action in actions:
+                sent_ids.append(action["_id"])
+                if len(sent_ids) == 2:
+                    raise exceptions.TransportError(429, "es_rejected_execution_exception")
+                yield True, {"index": {"_id": action["_id"], "status": 201}}
+
+        with patch('search.elastic.streaming_bulk', side_effect=fake_bulk):
+            success_count, errors = _bulk_with_retry(None, self._actions("1", "2", "3"))
+
+        self.assertEqual(success_count, 3)
+        self.assertEqual(errors, [])
+        self.assertEqual(sent_ids, ["1", "2", "2", "3"])
+
+    def test_failed_request(self):
+        """ bulk requests failing for other reasons should raise as before """
+        def fake_bulk(_client, _actions, **_kwargs):
+            """ fail the whole request """
+            raise exceptions.TransportError(500, "there is a problem here")
+            yield  # pylint: disable=unreachable
+
+        with patch('search.elastic.streaming_bulk', side_effect=fake_bulk):
+            with self.assertRaises(exceptions.TransportError):
+                _bulk_with_retry(None, self._actions("1"))
+
+
+class TestResultCacheKeys(TestCase):
+    """ Tests the naming of cached search results """
+
+    def setUp(self):
+        super(TestResultCacheKeys, self).setUp()
+        cache.clear()
+
+    def test_argument_order(self):
+        """ dictionary ordering should not affect the cache item name """
+        first = ElasticSearchEngine.get_result_cache_item_name("test_index", {
+            "field_dictionary": {"course": "A/B/C", "org": "edX"},
+            "exclude_dictionary": {"id": ["1", "2"]},
+        })
+        second = ElasticSearchEngine.get_result_cache_item_name("test_index", {
+            "exclude_dictionary": {"id": ["1", "2"]},
+            "field_dictionary": {"org": "edX", "course": "A/B/C"},
+        })
+        self.assertEqual(first, second)
+
+        different = ElasticSearchEngine.get_result_cache_item_name("test_index", {
+            "field_dictionary": {"course": "A/B/C", "org": "MITx"},
+            "exclude_dictionary": {"id": ["1", "2"]},
+        })
+        self.assertNotEqual(first, different)
+        self.assertNotEqual(first, ElasticSearchEngine.get_result_cache_item_name("other_index", {
+            "field_dictionary": {"course": "A/B/C", "org": "edX"},
+            "exclude_dictionary": {"id": ["1", "2"]},
+        }))
+
+    def test_date_ranges(self):
+        """ ranges should share a cache item only when exactly the same """
+        first = ElasticSearchEngine.get_result_cache_item_name("test_index", {
+            "field_dictionary": {"enrollment_start": DateRange(None, datetime(2015, 3, 1, 12, 30, 5, 100))}
+        })
+        self.assertEqual(first, ElasticSearchEngine.get_result_cache_item_name("test_index", {
+            "field_dictionary": {"enrollment_start": DateRange(None, datetime(2015, 3, 1, 12, 30, 5, 100))}
+        }))
+
+        # precise ranges within the same minute are different searches
+        self.assertNotEqual(first, ElasticSearchEngine.get_result_cache_item_name("test_index", {
+            "field_dictionary": {"enrollment_start": DateRange(None, datetime(2015, 3, 1, 12, 30, 45, 900))}
+        }))
+
+        different = ElasticSearchEngine.get_result_cache_item_name("test_index", {
+            "field_dictionary": {"enrollment_start": DateRange(datetime(2015, 3, 1, 12, 30, 5, 100), None)}
+        })
+        self.assertNotEqual(first, different)
+
+    def test_generation(self):
+        """ bumping the generation should change the cache item name """
+        search_arguments = {"query_string": "abc"}
+        first = ElasticSearchEngine.get_result_cache_item_name("test_index", search_arguments)
+        self.assertEqual(first, ElasticSearchEngine.get_result_cache_item_name("test_index", search_arguments))
+
+        ElasticSearchEngine.bump_result_generation("test_index")
+        self.assertNotEqual(first, ElasticSearchEngine.get_result_cache_item_name("test_index", search_arguments))
+
+
+class TestInterprocessLock(TestCase):
+    """ Tests the lock with which processes take turns at identical searches """
+
+    def setUp(self):
+        super(TestInterprocessLock, self).setUp()
+        self.lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.lock_dir)
+
+    def test_bounded_wait(self):
+        """ waiting for a lock that is held should give up after the timeout """
+        with _interprocess_lock(self.lock_dir, "search", 1) as locked:
+            self.assertTrue(locked)
+            start = time.time()
+            with _interprocess_lock(self.lock_dir, "search", 0.2) as other_locked:
+                self.assertFalse(other_locked)
+            self.assertLess(time.time() - start, 1)
+
+            # other names have locks of their own
+            with _interprocess_lock(self.lock_dir, "other search", 0) as other_locked:
+                self.assertTrue(other_locked)
+
+        # the lock files are removed upon release
+        self.assertEqual(os.listdir(self.lock_dir), [])
+        with _interprocess_lock(self.lock_dir, "search", 0) as locked:
+            self.assertTrue(locked)
+
+
+class TestQueryBody(TestCase):
+    """ Tests the structure of the queries sent to elasticsearch """
+
+    def test_filter_context(self):
+        """ filters and exclusions should be in filter context, without deprecated filters """
+        body = _build_search_body(
+            query_string="find me",
+            field_dictionary={"course": "A/B/C"},
+            filter_dictionary={"start_date": DateRange(None, datetime(2015, 1, 1)), "group": None},
+            exclude_dictionary={"org": ["MITx", "edX"]},
+        )
+        self.assertEqual(body["query"]["bool"]["must"], [{
+            "query_string": {"fields": ["content.*"], "query": "find me"}
+        }])
+        self.assertEqual(body["query"]["bool"]["filter"], [
+            {"term": {"course": "A/B/C"}},
+            {"bool": {"must_not": [{"exists": {"field": "group"}}]}},
+            {
+                "bool": {
+                    "should": [
+                        {"range": {"start_date": {"lte": "2015-01-01T00:00:00"}}},
+                        {"bool": {"must_not": [{"exists": {"field": "start_date"}}]}},
+                    ],
+                    "minimum_should_match": 1
+                }
+            },
+        ])
+        self.assertEqual(body["query"]["bool"]["must_not"], [{"terms": {"org": ["MITx", "edX"]}}])
+
+        self.assertEqual(_build_search_body(), {"query": {"bool": {"must": [{"match_all": {}}]}}})
+        self.assertNotIn("must_not", _build_search_body(exclude_dictionary={"org": []})["query"]["bool"])
+
+    def test_stable_structure(self):
+        """ the same arguments in a different order should make the same query """
+        first = _build_search_body(
+            field_dictionary={"course": "A/B/C", "org": ["edX", "MITx"]},
+            exclude_dictionary={"id": ["2", "1"], "org": "HarvardX"},
+        )
+        second = _build_search_body(
+            field_dictionary={"org": ["MITx", "edX"], "course": "A/B/C"},
+            exclude_dictionary={"org": "HarvardX", "id": ["1", "2"]},
+        )
+        self.assertEqual(json.dumps(first), json.dumps(second))
+
+
+class TestFacetAggregations(TestCase):
+    """ Tests the facets are requested as aggregations, and read back in the facet format """
+
+    def test_selections(self):
+        """ selections should filter the hits, and the aggregations upon the other facets """
+        body = _build_search_body(
+            facet_terms={"org": {"size": 5}, "modes": {}},
+            facet_selection_dictionary={"org": "OrgA"}
+        )
+        self.assertEqual(body["post_filter"], {"bool": {"filter": [{"term": {"org": "OrgA"}}]}})
+        self.assertEqual(body["aggs"]["org"], {
+            "filter": {"match_all": {}},
+            "aggs": {"terms": {"terms": {"field": "org", "size": 5}}},
+        })
+        self.assertEqual(body["aggs"]["modes"], {
+            "filter": {"bool": {"filter": [{"term": {"org": "OrgA"}}]}},
+            "aggs": {"terms": {"terms": {"field": "modes"}}},
+        })
+
+        body = _build_search_body(facet_terms={"org": {}})
+        self.assertNotIn("post_filter", body)
+        self.assertEqual(body["aggs"], {"org": {"terms": {"field": "org"}}})
+
+    def test_translation(self):
+        """ aggregation buckets should be translated into terms, total and other """
+        response = _translate_hits({
+            "took": 2,
+            "hits": {"total": 0, "max_score": None, "hits": []},
+            "aggregations": {
+                "org": {
+                    "doc_count_error_upper_bound": 0,
+                    "sum_other_doc_count": 3,
+                    "buckets": [{"key": "OrgA", "doc_count": 4}, {"key": "OrgB", "doc_count": 2}],
+                },
+                "modes": {
+                    "doc_count": 4,
+                    "terms": {
+                        "sum_other_doc_count": 0,
+                        "buckets": [{"key": "honor", "doc_count": 3}, {"key": "verified", "doc_count": 2}],
+                    },
+                },
+            },
+        })
+        self.assertEqual(response["facets"], {
+            "org": {"terms": {"OrgA": 4, "OrgB": 2}, "total": 9, "other": 3},
+            "modes": {"terms": {"honor": 3, "verified": 2}, "total": 5, "other": 0},
+        })
+
 
 @override_settings(MOCK_SEARCH_BACKING_FILE="./testfile.pkl")
 class FileBackedMockSearchTests(MockSearchTests):
@@ -188,6 +1000,13 @@ class ErroringElasticTests(TestCase, SearcherMixin):
             with self.assertRaises(exceptions.ElasticsearchException):
                 self.searcher.index("test_doc", [{"name": "abc test"}])
 
+    @override_settings(ELASTIC_SEARCH_BULK_THREAD_COUNT=2, ELASTIC_SEARCH_BULK_CHUNK_SIZE=1)
+    def test_index_failure_parallel(self):
+        """ errors from any of the concurrently sent chunks should fail the index operation """
+        with patch('search.elastic.bulk', return_value=[0, [exceptions.ElasticsearchException()]]):
+            with self.assertRaises(exceptions.ElasticsearchException):
+                self.searcher.index("test_doc", [{"name": "abc test"}, {"name": "xyz test"}])
+
     def test_index_failure_general(self):
         """ the index operation should fail """
         with patch('search.elastic.bulk', side_effect=Exception()):
@@ -199,6 +1018,11 @@ class ErroringElasticTests(TestCase, SearcherMixin):
         with self.assertRaises(exceptions.ElasticsearchException):
             self.searcher.search("abc test")
 
+    def test_count_failure(self):
+        """ the count operation should fail """
+        with self.assertRaises(exceptions.ElasticsearchException):
+            self.searcher.count("abc test")
+
     def test_remove_failure_bulk(self):
         """ the remove operation should fail """
         with patch('search.elastic.bulk', return_value=[0, [exceptions.ElasticsearchException()]]):
@@ -232,3 +1056,54 @@ class TestElasticConfig(TestCase, SearcherMixin):
         elasticsearch = self.searcher._es  # pylint: disable=protected-access
         hosts = elasticsearch.transport.hosts
         self.assertEqual(hosts, [{'host': '127.0.0.1'}, {'host': 'localhost'}])
+
+
+@override_settings(SEARCH_ENGINE="search.tests.mock_search_engine.MockSearchEngine")
+@override_settings(MOCK_SEARCH_BACKING_FILE=None)
+class TestEngineRegistry(TestCase):
+    """ Tests that engines and clients are shared across requests """
+
+    def tearDown(self):
+        SearchEngine.clear_search_engines()
+        super(TestEngineRegistry, self).tearDown()
+
+    def test_engine_reused(self):
+        """ the same engine should be returned for the same index until cleared """
+        engine = SearchEngine.get_search_engine("test_index_a")
+        self.assertIs(engine, SearchEngine.get_search_engine("test_index_a"))
+        self.assertIsNot(engine, SearchEngine.get_search_engine("test_index_b"))
+
+        SearchEngine.clear_search_engines()
+        self.assertIsNot(engine, SearchEngine.get_search_engine("test_index_a"))
+
+    def test_engine_per_class(self):
+        """ changing the engine setting should yield an engine of the new class """
+        engine = SearchEngine.get_search_engine("test_index_a")
+        with self.settings(SEARCH_ENGINE="search.tests.utils.ErroringSearchEngine"):
+            self.assertIsNot(engine, SearchEngine.get_search_engine("test_index_a"))
+
+    def test_engine_not_shared_after_fork(self):
+        """ a change of process id should cause engines to be created afresh """
+        engine = SearchEngine.get_search_engine("test_index_a")
+        with patch('search.utils.os.getpid', return_value=os.getpid() + 1):
+            forked_engine = SearchEngine.get_search_engine("test_index_a")
+            self.assertIsNot(engine, forked_engine)
+            self.assertIs(forked_engine, SearchEngine.get_search_engine("test_index_a"))
+
+    @override_settings(COURSEWARE_INDEX_NAME="test_index_a")
+    def test_warm_search_engines(self):
+        """ warming should create the engine that later requests receive """
+        engines = SearchEngine.warm_search_engines()
+        self.assertEqual(len(engines), 1)
+        self.assertIs(engines[0], SearchEngine.get_search_engine("test_index_a"))
+
+        engines = SearchEngine.warm_search_engines(["test_index_b", "test_index_c"])
+        self.assertEqual([engine.index_name for engine in engines], ["test_index_b", "test_index_c"])
+
+    @override_settings(ELASTIC_SEARCH_CONFIG=[{'host': '127.0.0.1'}])
+    def test_client_reused(self):
+        """ clients should be shared for the same configuration """
+        client = _get_elasticsearch_client()
+        self.assertIs(client, _get_elasticsearch_client())
+        with self.settings(ELASTIC_SEARCH_CONFIG=[{'host': 'localhost'}]):
+            self.assertIsNot(client, _get_elasticsearch_client())
@@ -0,0 +1,88 @@
+""" Tests for the background indexing queue """
+import time
+
+from django.test import TestCase
+
+from search.indexing_queue import IndexingQueue
+
+
+class RecordingEngine(object):
+    """ Engine stand-in which records the operations performed upon it """
+
+    def __init__(self):
+        self.operations = []
+
+    def index(self, doc_type, sources):
+        """ record indexing """
+        self.operations.append(("index", doc_type, [source.get("version", source.get("id")) for source in sources]))
+
+    def remove(self, doc_type, doc_ids):
+        """ record removal """
+        self.operations.append(("remove", doc_type, list(doc_ids)))
+
+
+class IndexingQueueTests(TestCase):
+    """ Tests batching and coalescing of queued operations """
+
+    def setUp(self):
+        super(IndexingQueueTests, self).setUp()
+        self.engine = RecordingEngine()
+
+    def test_coalesce(self):
+        """ later operations upon the same document should replace earlier ones """
+        queue = IndexingQueue(self.engine, batch_size=100, delay=60)
+        queue.add_index("test_doc", [{"id": "1", "version": "1a"}, {"id": "2", "version": "2a"}])
+        queue.add_index("test_doc", [{"id": "1", "version": "1b"}])
+        queue.add_remove("test_doc", ["2", "3"])
+        queue.add_index("other_doc", [{"id": "1", "version": "other"}])
+        queue.add_index("test_doc", [{"version": "no_id"}, {"version": "no_id"}])
+        queue.flush()
+
+        self.assertEqual(self.engine.operations, [
+            ("remove", "test_doc", ["2", "3"]),
+            ("index", "test_doc", ["1b", "no_id", "no_id"]),
+            ("index", "other_doc", ["other"]),
+        ])
+
+        # nothing left to do
+        queue.flush()
+        self.assertEqual(len(self.engine.operations), 3)
+
+    def test_batch_size(self):
+        """ a full batch should be sent without waiting for the delay """
+        queue = IndexingQueue(self.engine, batch_size=2, delay=60)
+        queue.add_index("test_doc", [{"id": str(doc_id)} for doc_id in range(5)])
+        self._wait_for_operations(2)
+        self.assertEqual(self.engine.operations[:2], [
+            ("index", "test_doc", ["0", "1"]),
+            ("index", "test_doc", ["2", "3"]),
+        ])
+
+        queue.flush()
+        self.assertEqual(self.engine.operations[2:], [("index", "test_doc", ["4"])])
+
+    def test_delay(self):
+        """ operations should be sent once they have waited for the delay """
+        queue = IndexingQueue(self.engine, batch_size=100, delay=0.1)
+        queue.add_index("test_doc", [{"id": "1"}])
+        self._wait_for_operations(1)
+        self.assertEqual(self.engine.operations, [("index", "test_doc", ["1"])])
+
+    def test_errors_logged(self):
+        """ a failing operation should not stop the others """
+        def failing_remove(doc_type, doc_ids):  # pylint: disable=unused-argument
+            """ fail """
+            raise StandardError("There is a problem here")
+        self.engine.remove = failing_remove
+
+        queue = IndexingQueue(self.engine, batch_size=100, delay=60)
+        queue.add_remove("test_doc", ["1"])
+        queue.add_index("test_doc", [{"id": "2"}])
+        queue.flush()
+        self.assertEqual(self.engine.operations, [("index", "test_doc", ["2"])])
+
+    def _wait_for_operations(self, count):
+        """ give the worker thread a few seconds to get the operations done """
+        deadline = time.time() + 5
+        while len(self.engine.operations) < count and time.time() < deadline:
+            time.sleep(0.01)
@@ -0,0 +1,66 @@
+""" Tests for the index partitioning strategies """
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from search.partitioning import FieldValuePartitioner, IndexPartitioner
+from search.utils import ValueRange
+
+
+class IndexPartitionerTests(TestCase):
+    """ Tests the default strategy keeps everything within the index """
+
+    def test_single_index(self):
+        """ documents are stored in, and searches visit, the index alone """
+        partitioner = IndexPartitioner("test_index")
+        self.assertFalse(partitioner.is_partitioned)
+        self.assertEqual(partitioner.document_index("test_doc", {"org": "MITx"}), "test_index")
+        self.assertEqual(partitioner.search_indices({"org": "MITx"}), "test_index")
+        self.assertEqual(partitioner.search_indices(), "test_index")
+        self.assertEqual(partitioner.index_names(), ["test_index"])
+
+
+@override_settings(SEARCH_PARTITION_VALUES=["MITx", "Harvard X"])
+class FieldValuePartitionerTests(TestCase):
+    """ Tests partitioning by the value of a field """
+
+    def setUp(self):
+        super(FieldValuePartitionerTests, self).setUp()
+        self.partitioner = FieldValuePartitioner("test_index")
+
+    def test_document_index(self):
+        """ documents with a partitioned value go to its index, others stay in the index itself """
+        self.assertTrue(self.partitioner.is_partitioned)
+        self.assertEqual(self.partitioner.document_index("test_doc", {"org": "MITx"}), "test_index__mitx")
+        self.assertEqual(self.partitioner.document_index("test_doc", {"org": "Harvard X"}), "test_index__harvard-x")
+        self.assertEqual(self.partitioner.document_index("test_doc", {"org": "edX"}), "test_index")
+        self.assertEqual(self.partitioner.document_index("test_doc", {"id": "no_org"}), "test_index")
+        self.assertEqual(self.partitioner.document_index("test_doc", {"org": ["MITx", "edX"]}), "test_index")
+
+    def test_search_indices(self):
+        """ searches pinned to values visit their indices and the index itself, others visit everything """
+        self.assertEqual(self.partitioner.search_indices({"org": "MITx"}), "test_index,test_index__mitx")
+        self.assertEqual(self.partitioner.search_indices({"org": "edX"}), "test_index")
+        self.assertEqual(
+            self.partitioner.search_indices({"org": ["edX", "MITx", "MITx"]}),
+            "test_index,test_index__mitx"
+        )
+        self.assertEqual(self.partitioner.search_indices(), "test_index,test_index__*")
+        self.assertEqual(self.partitioner.search_indices({"course": "A/B/C"}), "test_index,test_index__*")
+        self.assertEqual(
+            self.partitioner.search_indices({"org": ValueRange("A", "N")}),
+            "test_index,test_index__*"
+        )
+
+    def test_index_names(self):
+        """ the index and each partition are known ahead of any documents """
+        self.assertEqual(
+            self.partitioner.index_names(),
+            ["test_index", "test_index__harvard-x", "test_index__mitx"]
+        )
+
+    @override_settings(SEARCH_PARTITION_FIELD="course")
+    def test_partition_field(self):
+        """ the field to partition upon is configurable """
+        partitioner = FieldValuePartitioner("test_index")
+        self.assertEqual(partitioner.document_index("test_doc", {"org": "MITx"}), "test_index")
+        self.assertEqual(partitioner.document_index("test_doc", {"course": "MITx"}), "test_index__mitx")
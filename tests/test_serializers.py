@@ -0,0 +1,80 @@
+""" Tests for the pluggable json serializers """
+from datetime import datetime
+from decimal import Decimal
+import json
+from unittest import skipIf
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import TestCase
+from django.test.utils import override_settings
+from elasticsearch.exceptions import SerializationError
+from mock import patch
+
+from search.elastic import _get_elasticsearch_client
+from search.serializers import JSONSerializer, SimpleJSONSerializer, get_json_serializer, simplejson
+from search.tests.utils import post_request
+
+
+class JSONSerializerTests(TestCase):
+    """ Tests the serializers encode as the views always have """
+    serializer_class = JSONSerializer
+
+    def test_round_trip(self):
+        """ values should be encoded as DjangoJSONEncoder does, and decoded again """
+        serializer = self.serializer_class()
+        data = {
+            "start": datetime(2015, 1, 1, 12, 30, 15, 123456),
+            "price": Decimal("10.50"),
+            "names": [u"caf\xe9", "plain"],
+        }
+        serialized = serializer.dumps(data)
+        self.assertEqual(json.loads(serialized), json.loads(json.dumps(data, cls=DjangoJSONEncoder)))
+        self.assertEqual(
+            serializer.loads(serialized),
+            {"start": "2015-01-01T12:30:15.123", "price": "10.50", "names": [u"caf\xe9", "plain"]}
+        )
+
+    def test_strings_unchanged(self):
+        """ already serialized strings should be passed through """
+        serializer = self.serializer_class()
+        self.assertEqual(serializer.dumps('{"already": "serialized"}'), '{"already": "serialized"}')
+
+    def test_errors(self):
+        """ problems should be raised as the elasticsearch client expects """
+        serializer = self.serializer_class()
+        with self.assertRaises(SerializationError):
+            serializer.dumps({"unknown": object()})
+        with self.assertRaises(SerializationError):
+            serializer.loads("not json")
+
+
+@skipIf(simplejson is None, "simplejson is not installed")
+class SimpleJSONSerializerTests(JSONSerializerTests):
+    """ Tests the simplejson serializer in the same way """
+    serializer_class = SimpleJSONSerializer
+
+
+class ConfiguredSerializer(JSONSerializer):
+    """ Serializer to be found from settings """
+    pass
+
+
+@override_settings(SEARCH_ENGINE="search.tests.mock_search_engine.MockSearchEngine")
+class SerializerSettingTests(TestCase):
+    """ Tests the serializer setting is applied """
+
+    def test_default(self):
+        """ the standard library serializer is used unless configured otherwise """
+        self.assertIsInstance(get_json_serializer(), JSONSerializer)
+        self.assertIs(get_json_serializer(), get_json_serializer())
+
+    @override_settings(SEARCH_JSON_SERIALIZER="search.tests.test_serializers.ConfiguredSerializer")
+    @patch('search.views.track')
+    def test_configured(self, _mock_tracker):
+        """ the configured serializer is used by both the client and the views """
+        self.assertIsInstance(get_json_serializer(), ConfiguredSerializer)
+        self.assertIs(_get_elasticsearch_client().transport.serializer, get_json_serializer())
+
+        code, results = post_request({"search_string": "nothing to find"})
+        self.assertTrue(199 < code < 300)
+        self.assertEqual(results["total"], 0)
@@ -0,0 +1,110 @@
+""" Tests for utility classes """
+import threading
+import time
+
+from django.test import TestCase
+from mock import patch
+
+from search.utils import LRUCache, SingleFlight
+
+
+class LRUCacheTests(TestCase):
+    """ Tests the in-process cache """
+
+    def test_eviction(self):
+        """ the least recently used item should be evicted when full """
+        lru_cache = LRUCache(2, 60)
+        lru_cache.set("a", 1)
+        lru_cache.set("b", 2)
+        self.assertEqual(lru_cache.get("a"), 1)
+
+        lru_cache.set("c", 3)
+        self.assertIsNone(lru_cache.get("b"))
+        self.assertEqual(lru_cache.get("a"), 1)
+        self.assertEqual(lru_cache.get("c"), 3)
+
+        lru_cache.delete("a")
+        self.assertEqual(lru_cache.get("a", "missing"), "missing")
+        lru_cache.clear()
+        self.assertIsNone(lru_cache.get("c"))
+
+    def test_timeout(self):
+        """ items should not be returned once expired """
+        lru_cache = LRUCache(2, 60)
+        with patch('search.utils.time.time', return_value=1000):
+            lru_cache.set("a", 1)
+        with patch('search.utils.time.time', return_value=1059):
+            self.assertEqual(lru_cache.get("a"), 1)
+        with patch('search.utils.time.time', return_value=1061):
+            self.assertIsNone(lru_cache.get("a"))
+
+
+class SingleFlightTests(TestCase):
+    """ Tests coalescing of concurrent calls """
+
+    def test_sequential_calls(self):
+        """ calls which do not overlap each do their own work """
+        flights = SingleFlight()
+        calls = []
+
+        def work():
+            """ record the call """
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(flights.do("key", work), (1, False))
+        self.assertEqual(flights.do("key", work), (2, False))
+
+    def test_concurrent_calls(self):
+        """ callers arriving while a call is in progress share its result """
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        outcomes = []
+
+        def work():
+            """ hold the call open until released """
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "result"
+
+        def call_work():
+            """ make the coalesced call """
+            outcomes.append(flights.do("key", work))
+
+        leader = threading.Thread(target=call_work)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=call_work) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        # pylint: disable=protected-access
+        while flights._calls["key"].waiters < len(followers):
+            time.sleep(0.01)
+
+        # different keys are not held up by the call in progress
+        self.assertEqual(flights.do("other_key", lambda: "other"), ("other", False))
+
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(outcomes), 4)
+        self.assertTrue(all(outcome == ("result", True) for outcome in outcomes))
+
+    def test_errors_shared(self):
+        """ an exception from the call is raised to the caller """
+        flights = SingleFlight()
+
+        def work():
+            """ fail """
+            raise ValueError("There is a problem here")
+
+        with self.assertRaises(ValueError):
+            flights.do("key", work)
+
+        # and the failed call does not linger
+        self.assertEqual(flights.do("key", lambda: "result"), ("result", False))
@@ -1,8 +1,11 @@
 """ High-level view tests"""
 from datetime import datetime
+import gzip
+from io import BytesIO
+import json
 
 from django.core.urlresolvers import Resolver404, resolve
-from django.test import TestCase
+from django.test import Client, TestCase
 from django.test.utils import override_settings
 from mock import patch, call
 
@@ -361,6 +364,127 @@ class MockSearchUrlTest(TestCase, SearcherMixin):
         self.assert_initiated_return_events("Little Darling", 2, 1, 3)
         self._reset_mocked_tracker()
 
+    def test_cursor_pagination(self):
+        """ test paging through results using the cursor returned with each page """
+        self.searcher.index(
+            "courseware_content",
+            [
+                {
+                    "course": "ABC",
+                    "id": "FAKE_ID_{}".format(index),
+                    "content": {
+                        "text": "Little Darling, it's been a long long lonely winter"
+                    }
+                }
+                for index in [3, 1, 2]
+            ]
+        )
+
+        # no cursor is returned unless asked for
+        code, results = post_request({"search_string": "Little Darling", "page_size": 2})
+        self.assertTrue(199 < code < 300)
+        self.assertNotIn("cursor", results)
+
+        code, results = post_request({"search_string": "Little Darling", "page_size": 2, "cursor": ""})
+        self.assertTrue(199 < code < 300)
+        self.assertEqual(results["total"], 3)
+        result_ids = [r["data"]["id"] for r in results["results"]]
+        self.assertEqual(result_ids, ["FAKE_ID_1", "FAKE_ID_2"])
+        self.assertTrue(results["cursor"])
+
+        # paging by cursor is reported as such, without a page number unless the client counts pages
+        self.assertEqual(self.mock_tracker.emit.mock_calls[-1], call(  # pylint: disable=maybe-no-member
+            'edx.course.search.results_displayed',
+            {
+                "search_term": u"Little Darling",
+                "page_size": 2,
+                "page_number": None,
+                "cursor_paging": True,
+                "results_count": 3,
+            }
+        ))
+
+        code, results = post_request({
+            "search_string": "Little Darling", "page_size": 2, "page_index": 1, "cursor": results["cursor"]
+        })
+        self.assertTrue(199 < code < 300)
+        self.assertEqual(results["total"], 3)
+        result_ids = [r["data"]["id"] for r in results["results"]]
+        self.assertEqual(result_ids, ["FAKE_ID_3"])
+        self.assertIsNone(results["cursor"])
+        self.assertEqual(self.mock_tracker.emit.mock_calls[-1], call(  # pylint: disable=maybe-no-member
+            'edx.course.search.results_displayed',
+            {
+                "search_term": u"Little Darling",
+                "page_size": 2,
+                "page_number": 1,
+                "cursor_paging": True,
+                "results_count": 3,
+            }
+        ))
+
+        code, results = post_request({"search_string": "Little Darling", "page_size": 2, "cursor": "not a cursor"})
+        self.assertEqual(code, 500)
+        self.assertIn("Invalid cursor", results["error"])
+
+    @override_settings(SEARCH_RESULT_SOURCE_EXCLUDES=["content.text"])
+    def test_source_filtering(self):
+        """ test that only the configured fields are fetched for the results """
+        self.searcher.index(
+            "courseware_content",
+            [
+                {
+                    "course": "ABC",
+                    "id": "FAKE_ID_1",
+                    "content": {
+                        "display_name": "Little Darling",
+                        "text": "Little Darling, it's been a long long lonely winter"
+                    }
+                }
+            ]
+        )
+
+        code, results = post_request({"search_string": "Little Darling"})
+        self.assertTrue(199 < code < 300)
+        self.assertEqual(results["total"], 1)
+        self.assertEqual(results["results"][0]["data"]["content"], {"display_name": "Little Darling"})
+        self.assertIn("Darling", results["results"][0]["data"]["excerpt"])
+
+    @override_settings(SEARCH_RESPONSE_GZIP_MIN_LENGTH=200)
+    def test_compressed_response(self):
+        """ test that large enough responses are compressed for clients that accept gzip """
+        self.searcher.index(
+            "courseware_content",
+            [
+                {
+                    "course": "ABC",
+                    "id": "FAKE_ID_{}".format(index),
+                    "content": {
+                        "text": "Little Darling, it's been a long long lonely winter"
+                    }
+                }
+                for index in range(10)
+            ]
+        )
+
+        response = Client().post('/', {"search_string": "Little Darling"}, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        results = json.loads(gzip.GzipFile(fileobj=BytesIO(response.content)).read())
+        self.assertEqual(results["total"], 10)
+
+        # not for clients that do not ask for it
+        response = Client().post('/', {"search_string": "Little Darling"})
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(json.loads(response.content)["total"], 10)
+
+        # nor for small responses
+        response = Client().post('/', {"search_string": "Xylophone"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertLess(len(response.content), 1024)
+        self.assertEqual(json.loads(response.content)["total"], 0)
+
     def test_page_size_too_large(self):
         """ test searching with too-large page_size """
         self.searcher.index(
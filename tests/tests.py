@@ -76,6 +76,10 @@ class MockSearchTests(TestCase, SearcherMixin):
             abstract.search(test_string)
         with self.assertRaises(NotImplementedError):
             abstract.remove("test_doc", ["test_id"])
+        with self.assertRaises(NotImplementedError):
+            list(abstract.scan(test_string))
+        with self.assertRaises(NotImplementedError):
+            abstract.count(test_string)
 
     def test_find_all(self):
         """ Make sure that null search finds everything in the index """
@@ -348,6 +352,150 @@ class MockSearchTests(TestCase, SearcherMixin):
         response = self.searcher.search(test_string)
         self.assertEqual(response["total"], 0)
 
+    def test_index_stream(self):
+        """ make sure that documents from a generator are indexed in chunks """
+        def sources():
+            """ generate the documents, one at a time """
+            for doc_index in range(7):
+                yield {"id": "FAKE_ID_{}".format(doc_index), "content": {"name": "streamed document"}}
+
+        chunks = list(self.searcher.index_stream("test_doc", sources(), chunk_size=3))
+        self.assertEqual(chunks, [(3, []), (3, []), (1, [])])
+
+        response = self.searcher.search_string("streamed")
+        self.assertEqual(response["total"], 7)
+
+    def test_queued_operations(self):
+        """ make sure that queued operations are performed once flushed """
+        self.searcher.queue_index("test_doc", [{"id": "FAKE_ID_1", "content": {"name": "queued document"}}])
+        self.searcher.queue_index("test_doc", [{"id": "FAKE_ID_2", "content": {"name": "queued document"}}])
+        self.searcher.queue_remove("test_doc", ["FAKE_ID_2"])
+        self.searcher.flush_queue()
+
+        response = self.searcher.search_string("queued")
+        self.assertEqual(response["total"], 1)
+        self.assertEqual(response["results"][0]["data"]["id"], "FAKE_ID_1")
+
+    def test_scan(self):
+        """ make sure that scanning yields every matching document, beyond the size of a single page """
+        self.searcher.index("test_doc", [
+            {"id": "FAKE_ID_{}".format(doc_index), "content": {"name": "scanned document"}, "course": "A/B/C"}
+            for doc_index in range(25)
+        ])
+        self.searcher.index("test_doc", [
+            {"id": "OTHER_ID", "content": {"name": "scanned document"}, "course": "X/Y/Z"},
+        ])
+
+        results = list(self.searcher.scan(query_string="scanned", field_dictionary={"course": "A/B/C"}, size=10))
+        self.assertEqual(len(results), 25)
+        self.assertEqual(
+            set(result["data"]["id"] for result in results),
+            set("FAKE_ID_{}".format(doc_index) for doc_index in range(25))
+        )
+
+        results = list(self.searcher.scan(exclude_dictionary={"course": "A/B/C"}, doc_type="test_doc"))
+        self.assertEqual([result["data"]["id"] for result in results], ["OTHER_ID"])
+
+        self.assertEqual(list(self.searcher.scan(query_string="something else")), [])
+
+    def test_count(self):
+        """ make sure that counting matches the total from the equivalent search """
+        self.searcher.index("test_doc", [
+            {"id": "FAKE_ID_1", "content": {"name": "Nothing up my sleeve"}, "course": "A/B/C"},
+            {"id": "FAKE_ID_2", "content": {"name": "Nothing to see here"}, "course": "X/Y/Z"},
+        ])
+        self.searcher.index("not_test_doc", [{"id": "FAKE_ID_3", "content": {"name": "Nothing at all"}}])
+
+        searches = [
+            {"query_string": "nothing"},
+            {"query_string": "nothing", "doc_type": "test_doc"},
+            {"field_dictionary": {"course": "A/B/C"}},
+            {"query_string": "nothing", "exclude_dictionary": {"course": "X/Y/Z"}, "doc_type": "test_doc"},
+            {"query_string": "something else"},
+        ]
+        for search_args in searches:
+            self.assertEqual(self.searcher.count(**search_args), self.searcher.search(**search_args)["total"])
+        self.assertEqual([self.searcher.count(**search_args) for search_args in searches], [3, 2, 1, 1, 0])
+
+    def test_source_filtering(self):
+        """ make sure that only the requested fields of each document are returned """
+        self.searcher.index("test_doc", [{
+            "id": "FAKE_ID_1",
+            "course": "A/B/C",
+            "content": {"name": "Nothing up my sleeve", "text": "A long passage of text"},
+        }])
+
+        response = self.searcher.search(query_string="nothing", source_includes=["id", "content.name"])
+        self.assertEqual(response["total"], 1)
+        self.assertEqual(
+            response["results"][0]["data"],
+            {"id": "FAKE_ID_1", "content": {"name": "Nothing up my sleeve"}}
+        )
+
+        response = self.searcher.search(query_string="nothing", source_excludes=["content"])
+        self.assertEqual(response["results"][0]["data"], {"id": "FAKE_ID_1", "course": "A/B/C"})
+
+        response = self.searcher.search(query_string="nothing", source_includes=["content"], source_excludes=["*.text"])
+        self.assertEqual(response["results"][0]["data"], {"content": {"name": "Nothing up my sleeve"}})
+
+    def test_search_after(self):
+        """ make sure that paging with search_after visits every document once, in score then id order """
+        self.searcher.index("test_doc", [
+            {"id": "FAKE_ID_{}".format(doc_index), "content": {"name": "paged document"}}
+            for doc_index in range(5)
+        ])
+
+        result_ids = []
+        search_after = []
+        while True:
+            response = self.searcher.search(query_string="paged", size=2, search_after=search_after)
+            self.assertEqual(response["total"], 5)
+            if not response["results"]:
+                break
+            self.assertTrue(len(response["results"]) <= 2)
+            result_ids.extend(result["data"]["id"] for result in response["results"])
+            search_after = response["results"][-1]["sort"]
+
+        self.assertEqual(result_ids, ["FAKE_ID_{}".format(doc_index) for doc_index in range(5)])
+
+    def test_multi_search(self):
+        """ make sure that several searches performed at once match the individual searches """
+        self.searcher.index("test_doc", [
+            {"id": "FAKE_ID_1", "content": {"name": "Nothing up my sleeve"}, "course": "A/B/C"},
+            {"id": "FAKE_ID_2", "content": {"name": "Nothing to see here"}, "course": "X/Y/Z"},
+        ])
+        self.searcher.index("not_test_doc", [{"id": "FAKE_ID_3", "content": {"name": "Nothing at all"}}])
+
+        searches = [
+            {"query_string": "nothing"},
+            {"query_string": "nothing", "doc_type": "test_doc"},
+            {"field_dictionary": {"course": "A/B/C"}},
+            {"query_string": "nothing", "exclude_dictionary": {"course": "X/Y/Z"}, "doc_type": "test_doc"},
+            {"query_string": "nothing", "size": 1, "from_": 1},
+            {"query_string": "something else"},
+        ]
+        responses = self.searcher.multi_search(searches)
+        self.assertEqual([response["total"] for response in responses], [3, 2, 1, 1, 3, 0])
+        self.assertEqual(len(responses[4]["results"]), 1)
+        self.assertEqual(responses[2]["results"][0]["data"]["id"], "FAKE_ID_1")
+        self.assertEqual(responses[3]["results"][0]["data"]["id"], "FAKE_ID_1")
+
+        self.assertEqual(self.searcher.multi_search([]), [])
+
+    def test_async_operations(self):
+        """ make sure that the non-blocking operations yield the same outcomes as their blocking counterparts """
+        test_string = "This is a test of the emergency broadcast system"
+        self.searcher.async_index("test_doc", [{"id": "FAKE_ID", "content": {"name": test_string}}]).get()
+
+        pending = [self.searcher.async_search(test_string), self.searcher.async_search("something else")]
+        responses = [search.get() for search in pending]
+        self.assertEqual(responses[0]["total"], 1)
+        self.assertEqual(responses[1]["total"], 0)
+
+        self.searcher.async_remove("test_doc", ["FAKE_ID"]).get()
+        response = self.searcher.async_search(test_string, doc_type="test_doc").get()
+        self.assertEqual(response["total"], 0)
+
     def test_delete_item_slashes(self):
         """ make sure that we can remove an item from the index with complex id """
         test_string = "This is a test of the emergency broadcast system"
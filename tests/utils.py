@@ -53,6 +53,12 @@ class ForceRefreshElasticSearchEngine(ElasticSearchEngine):
         })
         super(ForceRefreshElasticSearchEngine, self).index(doc_type, sources, **kwargs)
 
+    def index_stream(self, doc_type, sources, **kwargs):
+        kwargs.update({
+            "refresh": True
+        })
+        return super(ForceRefreshElasticSearchEngine, self).index_stream(doc_type, sources, **kwargs)
+
     def remove(self, doc_type, doc_ids, **kwargs):
         kwargs.update({
             "refresh": True
@@ -81,3 +87,7 @@ class ErroringElasticImpl(Elasticsearch):
     def search(self, **kwargs):
         """ this will definitely fail """
         raise exceptions.ElasticsearchException("This search operation failed")
+
+    def count(self, **kwargs):
+        """ this will definitely fail """
+        raise exceptions.ElasticsearchException("This count operation failed")
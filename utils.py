@@ -1,6 +1,10 @@
 """ Utility classes to support others """
+from datetime import datetime
 import importlib
 import collections
+import os
+import threading
+import time
 
 
 def _load_class(class_path, default):
@@ -18,11 +22,162 @@ def _load_class(class_path, default):
     return result_processor
 
 
+def _utcnow_to_the_minute():
+    """
+    The current time, truncated to the minute - searches made within the same minute then filter
+    upon the same values, which lets elasticsearch reuse its cached filters
+    """
+    return datetime.utcnow().replace(second=0, microsecond=0)
+
+
 def _is_iterable(item):
     """ Checks if an item is iterable (list, tuple, generator), but not string """
     return isinstance(item, collections.Iterable) and not isinstance(item, basestring)
 
 
+class ProcessRegistry(object):
+
+    """
+    Process-wide store of shared objects (search engines, clients) that are
+    expensive to create and safe to reuse across requests
+
+    Objects are never shared across a fork - when the registry notices that it is
+    being used from a new process it forgets everything created in the parent, so
+    that connections get built afresh within the child
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_process(self):
+        """ drop objects inherited from a parent process """
+        pid = os.getpid()
+        if self._pid != pid:
+            # the lock may have been held by another thread of the parent when forked, so replace it too
+            self._items = {}
+            self._lock = threading.Lock()
+            self._pid = pid
+
+    def get_or_create(self, key, factory):
+        """ return the object stored against key, calling factory to create it if not yet present """
+        self._check_process()
+        try:
+            return self._items[key]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = factory()
+            return self._items[key]
+
+    def clear(self):
+        """ forget all stored objects, so that they get created again upon next request """
+        self._check_process()
+        with self._lock:
+            self._items = {}
+
+
+class SingleFlight(object):
+
+    """
+    Coalesces concurrent calls made for the same key, so that only the first caller does
+    the work and the others wait for (and share) its result
+    """
+
+    class _Call(object):
+        """ A call in progress """
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.waiters = 0
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Call func, unless a call for the same key is already in progress in which case wait for that
+        to complete instead. Returns a tuple of the result and whether that result is shared with other
+        callers; exceptions raised by func are raised to all callers
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = SingleFlight._Call()
+            else:
+                call.waiters += 1
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error  # pylint: disable=raising-bad-type
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception as ex:  # pylint: disable=broad-except
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, call.waiters > 0
+
+
+class LRUCache(object):
+
+    """
+    Size-bounded in-process cache, which evicts the least recently used items when full
+    and no longer returns items once they are older than timeout seconds
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """ return the value stored against key, or default if missing or expired """
+        with self._lock:
+            try:
+                expires, value = self._items.pop(key)
+            except KeyError:
+                return default
+            if expires < time.time():
+                return default
+            # re-insert, so that it becomes the most recently used
+            self._items[key] = (expires, value)
+            return value
+
+    def set(self, key, value):
+        """ store value against key, evicting the least recently used items if necessary """
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (time.time() + self.timeout, value)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        """ remove the value stored against key, if present """
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        """ remove all values """
+        with self._lock:
+            self._items.clear()
+
+
 class ValueRange(object):
 
     """ Object to represent a range of values """
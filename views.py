@@ -2,21 +2,25 @@
 # This contains just the url entry points to use if desired, which currently has only one
 # pylint: disable=too-few-public-methods
 import logging
-import json
+import re
 
 from django.conf import settings
-from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
 from django.utils.translation import ugettext as _
 from django.views.decorators.http import require_POST
 
 from eventtracking import tracker as track
 from .api import perform_search, course_discovery_search, course_discovery_filter_fields
 from .initializer import SearchInitializer
+from .serializers import get_json_serializer
 
 # log appears to be standard name used for logger
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
 
 def _process_pagination_values(request):
     """ process pagination requests from request parameter """
@@ -36,6 +40,27 @@ def _process_pagination_values(request):
     return size, from_, page
 
 
+def _process_cursor(request):
+    """ cursor from which to continue paging, if paging by cursor - None otherwise """
+    return request.POST.get("cursor", None)
+
+
+def _paging_event_values(request, size, page, cursor):
+    """
+    Pagination values to report with analytics events - when paging by cursor, this is flagged, and the page
+    number is only reported if the client counts pages itself within page_index
+    """
+    values = {
+        "page_size": size,
+        "page_number": page,
+    }
+    if cursor is not None:
+        values["cursor_paging"] = True
+        if "page_index" not in request.POST:
+            values["page_number"] = None
+    return values
+
+
 def _process_field_values(request):
     """ Create separate dictionary of supported filter values provided """
     return {
@@ -45,6 +70,34 @@ def _process_field_values(request):
     }
 
 
+def _json_response(request, results, status_code):
+    """
+    Create the json http response for the results, gzip compressed when the client accepts that and the
+    content is at least settings.SEARCH_RESPONSE_GZIP_MIN_LENGTH bytes (default 1024; None to never compress)
+    """
+    response = HttpResponse(
+        get_json_serializer().dumps(results),
+        content_type='application/json',
+        status=status_code
+    )
+
+    min_length = getattr(settings, "SEARCH_RESPONSE_GZIP_MIN_LENGTH", 1024)
+    if min_length is None:
+        return response
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if len(response.content) < min_length or not ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        return response
+
+    compressed_content = compress_string(response.content)
+    # tiny or incompressible content can come out larger
+    if len(compressed_content) < len(response.content):
+        response.content = compressed_content
+        response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = str(len(compressed_content))
+    return response
+
+
 @require_POST
 def do_search(request, course_id=None):
     """
@@ -60,6 +113,7 @@ def do_search(request, course_id=None):
             "total" - how many results were found
             "max_score" - maximum score from these results
             "results" - json array of result documents
+            "cursor" - (only when paging by cursor) token to provide to get the next page, null after the last page
 
             or
 
@@ -69,6 +123,9 @@ def do_search(request, course_id=None):
         "search_string" (required) - text upon which to search
         "page_size" (optional)- how many results to return per page (defaults to 20, with maximum cutoff at 100)
         "page_index" (optional) - for which page (zero-indexed) to include results (defaults to 0)
+        "cursor" (optional) - page by cursor rather than page_index: provide an empty value for the first page,
+            and the cursor returned with each page for the page after it - deep pages cost no more than the first;
+            page_index may still be provided alongside, as the page number to report to analytics
     """
 
     # Setup search environment
@@ -87,14 +144,13 @@ def do_search(request, course_id=None):
 
         size, from_, page = _process_pagination_values(request)
 
+        cursor = _process_cursor(request)
+        paging_values = _paging_event_values(request, size, page, cursor)
+
         # Analytics - log search request
         track.emit(
             'edx.course.search.initiated',
-            {
-                "search_term": search_term,
-                "page_size": size,
-                "page_number": page,
-            }
+            dict(paging_values, search_term=search_term)
         )
 
         results = perform_search(
@@ -102,7 +158,8 @@ def do_search(request, course_id=None):
             user=request.user,
             size=size,
             from_=from_,
-            course_id=course_id
+            course_id=course_id,
+            cursor=cursor
         )
 
         status_code = 200
@@ -110,12 +167,7 @@ def do_search(request, course_id=None):
         # Analytics - log search results before sending to browser
         track.emit(
             'edx.course.search.results_displayed',
-            {
-                "search_term": search_term,
-                "page_size": size,
-                "page_number": page,
-                "results_count": results["total"],
-            }
+            dict(paging_values, search_term=search_term, results_count=results["total"])
         )
 
     except ValueError as invalid_err:
@@ -136,11 +188,7 @@ def do_search(request, course_id=None):
             err
         )
 
-    return HttpResponse(
-        json.dumps(results, cls=DjangoJSONEncoder),
-        content_type='application/json',
-        status=status_code
-    )
+    return _json_response(request, results, status_code)
 
 
 @require_POST
@@ -157,6 +205,7 @@ def course_discovery(request):
             "total" - how many results were found
             "max_score" - maximum score from these resutls
             "results" - json array of result documents
+            "cursor" - (only when paging by cursor) token to provide to get the next page, null after the last page
 
             or
 
@@ -166,6 +215,9 @@ def course_discovery(request):
         "search_string" (optional) - text with which to search for courses
         "page_size" (optional)- how many results to return per page (defaults to 20, with maximum cutoff at 100)
         "page_index" (optional) - for which page (zero-indexed) to include results (defaults to 0)
+        "cursor" (optional) - page by cursor rather than page_index: provide an empty value for the first page,
+            and the cursor returned with each page for the page after it - deep pages cost no more than the first;
+            page_index may still be provided alongside, as the page number to report to analytics
     """
     results = {
         "error": _("Nothing to search")
@@ -178,14 +230,13 @@ def course_discovery(request):
         size, from_, page = _process_pagination_values(request)
         field_dictionary = _process_field_values(request)
 
+        cursor = _process_cursor(request)
+        paging_values = _paging_event_values(request, size, page, cursor)
+
         # Analytics - log search request
         track.emit(
             'edx.course_discovery.search.initiated',
-            {
-                "search_term": search_term,
-                "page_size": size,
-                "page_number": page,
-            }
+            dict(paging_values, search_term=search_term)
         )
 
         results = course_discovery_search(
@@ -193,17 +244,13 @@ def course_discovery(request):
             size=size,
             from_=from_,
             field_dictionary=field_dictionary,
+            cursor=cursor,
         )
 
         # Analytics - log search results before sending to browser
         track.emit(
             'edx.course_discovery.search.results_displayed',
-            {
-                "search_term": search_term,
-                "page_size": size,
-                "page_number": page,
-                "results_count": results["total"],
-            }
+            dict(paging_values, search_term=search_term, results_count=results["total"])
         )
 
         status_code = 200
@@ -226,8 +273,4 @@ def course_discovery(request):
             err
         )
 
-    return HttpResponse(
-        json.dumps(results, cls=DjangoJSONEncoder),
-        content_type='application/json',
-        status=status_code
-    )
+    return _json_response(request, results, status_code)